@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+import argparse
+import csv
+import hashlib
+import json
+from pathlib import Path
+
+from settings import ARCHIVE_DIR, DATA_DIR
+from snapshots import REP_FIELDS, snapshot_date, snapshot_paths
+from utils import dumps_csv, dumps_json, read_json, write_csv, write_if_changed, write_json
+
+FLAT_ID_FIELDS = set(REP_FIELDS) | {"rep_number"}
+
+
+def text_key(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class TextStore:
+    """Store of distinct interest texts keyed by hash, one JSON line per text, only rewritten when texts are removed"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.texts = {}
+        self._pending = []
+        if path.exists():
+            with path.open() as f:
+                for line in f:
+                    key, text = json.loads(line)
+                    self.texts[key] = text
+
+    def put(self, text):
+        key = text_key(text)
+        existing = self.texts.get(key)
+        if existing is None:
+            self.texts[key] = text
+            self._pending.append((key, text))
+        elif existing != text:
+            raise ValueError(f"Hash collision for text key {key}")
+        return key
+
+    def get(self, key):
+        return self.texts[key]
+
+    def flush(self):
+        if not self._pending:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a") as f:
+            for key, text in self._pending:
+                f.write(json.dumps([key, text], ensure_ascii=False) + "\n")
+        self._pending = []
+
+    def remove(self, keys):
+        self.flush()
+        for key in keys:
+            del self.texts[key]
+        lines = "".join(json.dumps([key, text], ensure_ascii=False) + "\n" for key, text in self.texts.items())
+        write_if_changed(self.path, lines.encode("utf-8"))
+
+
+class SnapshotArchive:
+    """
+    Deduplicated archive of parsed snapshots.
+
+    Each distinct interest text is stored once in texts.jsonl, each snapshot is a small JSON record in
+    snapshots/ referencing texts by hash. Snapshot JSON and CSV outputs can be restored byte for byte, in both the
+    current and the pre-2020-03-23 flattened format. Texts only the replaced version of a snapshot referred to are
+    removed.
+
+    The archive is the committed form of the snapshots, the outputs in data/ are working copies restored from it.
+    """
+
+    def __init__(self, archive_dir: Path = ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+        self.snapshots_dir = archive_dir.joinpath("snapshots")
+        self.store = TextStore(archive_dir.joinpath("texts.jsonl"))
+
+    def record_path(self, updated_at_str):
+        return self.snapshots_dir.joinpath(f"{updated_at_str}.json")
+
+    @staticmethod
+    def is_text_field(field, value):
+        return field not in FLAT_ID_FIELDS and isinstance(value, str)
+
+    @classmethod
+    def text_keys(cls, record):
+        if record["format"] == "reps":
+            return {key for rep in record["reps"] for key in rep["by_category"].values()}
+        return {value for row in record["rows"] for field, value in row.items() if cls.is_text_field(field, value)}
+
+    def encode(self, data, csv_fields):
+        put = self.store.put
+        if isinstance(data, dict):
+            reps = [
+                {**rep, "by_category": {cat: put(text) for cat, text in rep["by_category"].items()}}
+                for rep in data["reps"]
+            ]
+            return {"format": "reps", "csv_fields": csv_fields, "meta": data["_meta"], "reps": reps}
+
+        # legacy rows also have flags like "Ingen registrerte opplysninger": true, only texts go to the store
+        rows = [
+            {field: put(value) if self.is_text_field(field, value) else value for field, value in row.items()}
+            for row in data
+        ]
+        return {"format": "flat", "csv_fields": csv_fields, "rows": rows}
+
+    def decode(self, record):
+        """Snapshot data as in data/interests-<date>.json"""
+        get = self.store.get
+        if record["format"] == "reps":
+            reps = [
+                {**rep, "by_category": {cat: get(key) for cat, key in rep["by_category"].items()}}
+                for rep in record["reps"]
+            ]
+            return {"_meta": record["meta"], "reps": reps}
+
+        return [
+            {field: get(value) if self.is_text_field(field, value) else value for field, value in row.items()}
+            for row in record["rows"]
+        ]
+
+    def add(self, json_path: Path, csv_path: Path = None):
+        """Add or replace snapshot from its JSON and CSV outputs, returns False if the archive is unchanged"""
+        with json_path.open() as f:
+            data = json.load(f)
+        csv_path = csv_path or json_path.with_suffix(".csv")
+        with csv_path.open(newline="") as f:
+            csv_fields = next(csv.reader(f))
+
+        record_path = self.record_path(snapshot_date(json_path))
+        old_record = read_json(record_path)
+        record = self.encode(data, csv_fields)
+        self.store.flush()
+        self.snapshots_dir.mkdir(parents=True, exist_ok=True)
+        written = write_if_changed(record_path, dumps_json(record, compact=True).encode("utf-8"))
+        if written and old_record is not None:
+            self.remove_unreferenced(self.text_keys(old_record) - self.text_keys(record))
+        return written
+
+    def remove_unreferenced(self, keys):
+        """Remove the texts of keys that no archived snapshot refers to"""
+        for record_path in self.snapshots_dir.glob("*.json"):
+            if not keys:
+                return
+            keys -= self.text_keys(read_json(record_path))
+        self.store.remove(keys)
+
+    def add_all(self, data_dir: Path = DATA_DIR):
+        return sum(self.add(path) for path in snapshot_paths(data_dir))
+
+    def dates(self):
+        """Dates of archived snapshots, oldest first"""
+        if not self.snapshots_dir.exists():
+            return []
+        return sorted(record_path.stem for record_path in self.snapshots_dir.glob("*.json"))
+
+    def iter_snapshots(self, dates=None):
+        """Stream (updated_at, data, csv_fields) of dates (default all) oldest first, decoding one at a time"""
+        for updated_at_str in self.dates() if dates is None else dates:
+            with self.record_path(updated_at_str).open() as f:
+                record = json.load(f)
+            yield updated_at_str, self.decode(record), record["csv_fields"]
+
+    def rows(self, data):
+        """CSV rows of snapshot data"""
+        if isinstance(data, list):
+            return data
+
+        rows = []
+        for rep in data["reps"]:
+            row = {field: rep[field] for field in REP_FIELDS}
+            for category_key, text in rep["by_category"].items():
+                row[data["_meta"]["categories"][category_key]] = text
+            rows.append(row)
+        return rows
+
+    def restore(self, out_dir: Path, dates=None):
+        """Write interests-<date>.json and .csv for archived snapshots of dates (default all) to out_dir"""
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for updated_at_str, data, csv_fields in self.iter_snapshots(dates):
+            write_json(out_dir.joinpath(f"interests-{updated_at_str}.json"), data)
+            write_csv(out_dir.joinpath(f"interests-{updated_at_str}.csv"), self.rows(data), csv_fields)
+            yield updated_at_str
+
+    def restore_missing(self, data_dir: Path = DATA_DIR):
+        """Restore the outputs of archived snapshots that have no JSON in data_dir, e.g. in a fresh clone"""
+        missing = [
+            updated_at_str
+            for updated_at_str in self.dates()
+            if not data_dir.joinpath(f"interests-{updated_at_str}.json").exists()
+        ]
+        return list(self.restore(data_dir, missing)) if missing else []
+
+    def verify(self, data_dir: Path = DATA_DIR):
+        """Dates of archived snapshots whose restored JSON or CSV differs from the file in data_dir"""
+        mismatches = []
+        for updated_at_str, data, csv_fields in self.iter_snapshots():
+            json_path = data_dir.joinpath(f"interests-{updated_at_str}.json")
+            json_ok = json_path.read_bytes() == dumps_json(data).encode("utf-8")
+            csv_ok = json_path.with_suffix(".csv").read_bytes() == dumps_csv(self.rows(data), csv_fields).encode(
+                "utf-8"
+            )
+            if not (json_ok and csv_ok):
+                mismatches.append(updated_at_str)
+        return mismatches
+
+
+def parse_cli_args():
+    p = argparse.ArgumentParser(description="Deduplicated archive of parsed snapshots")
+    p.add_argument("--build", action="store_true", default=False, help="Add new and changed snapshots in DATA_DIR")
+    p.add_argument(
+        "--restore", metavar="DIR", help="Restore JSON and CSV outputs of all snapshots to DIR, e.g. data after a clone"
+    )
+    p.add_argument("--verify", action="store_true", default=False, help="Check restored outputs against DATA_DIR")
+
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_cli_args()
+    archive = SnapshotArchive()
+    if args.build:
+        print(f"Archived {archive.add_all()} snapshots")
+    if args.restore:
+        for restored in archive.restore(Path(args.restore)):
+            print(f"Restored {restored}")
+    if args.verify:
+        mismatches = archive.verify()
+        print(f"MISMATCHES: {len(mismatches)}")
+        for mismatch in mismatches:
+            print(mismatch)
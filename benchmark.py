@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+from subprocess import Popen, PIPE
+from time import perf_counter
+
+import xmltodict
+
+from parser import InterestParser
+from settings import BENCHMARK_BASELINE_PATH, PDF_DIR
+from utils import pdftohtml_args, read_json, write_csv, write_json
+
+FIXTURE_PATH = Path("testdata.json")
+STAGES = ("pdftohtml", "xml_to_dict", "first_page", "parse", "flatten", "write")
+DEFAULT_THRESHOLD = 0.25  # fraction slower than baseline that counts as a regression
+MIN_STAGE_SECONDS = 0.005  # stages faster than this in the baseline are too noisy to compare
+
+
+def run_pdftohtml(pdf_path):
+    p = Popen(pdftohtml_args(pdf_path), stdout=PIPE, stderr=PIPE)
+    out, err = p.communicate()
+    if p.returncode:
+        raise RuntimeError(f"pdftohtml failed for {pdf_path}: {err.decode('utf-8', 'replace')}")
+    return out
+
+
+def corpus_documents(corpus, pdf_dir=PDF_DIR, fixture_path=FIXTURE_PATH):
+    """(name, function returning pdftohtml XML) of documents in corpus"""
+    documents = []
+    if corpus in ("fixture", "all"):
+        with fixture_path.open() as f:
+            fixture_xml = xmltodict.unparse(json.load(f)).encode("utf-8")
+        documents.append((fixture_path.name, lambda: fixture_xml))
+    if corpus in ("pdfs", "all"):
+        documents += [(pdf.name, lambda pdf=pdf: run_pdftohtml(pdf)) for pdf in sorted(pdf_dir.glob("*.pdf"))]
+    return documents
+
+
+def bench_document(load_xml, out_dir: Path):
+    """Run all stages on one document, returns (stage timings, number of pages, number of reps)"""
+    timings = {}
+
+    def timed(stage, fn, *args):
+        start = perf_counter()
+        result = fn(*args)
+        timings[stage] = perf_counter() - start
+        return result
+
+    xml = timed("pdftohtml", load_xml)
+    pdf_dict = timed("xml_to_dict", lambda: xmltodict.parse(xml.decode("utf-8"), force_list=("page",)))
+    parser = InterestParser(pdf_dict=pdf_dict)
+    pages = parser.page_dicts
+    timed("first_page", lambda: parser.find_y_coords(parser.next_page_with_rep_data(pages)))
+    res = timed("parse", parser.parse_pdf_data)
+    flattened = timed("flatten", parser.flatten_data, res)
+
+    def write():
+        write_csv(out_dir.joinpath("interests.csv"), flattened, parser.field_names())
+        write_json(out_dir.joinpath("interests.json"), parser.snapshot_data("benchmark", res))
+
+    timed("write", write)
+    return timings, len(pages), len(res)
+
+
+def peak_memory(load_xml, out_dir: Path):
+    """Peak traced memory in bytes of a full run over one document"""
+    tracemalloc.start()
+    try:
+        bench_document(load_xml, out_dir)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmark(documents, repeat=3, memory=True):
+    """
+    Benchmark documents, keeping the fastest of repeat runs per stage and document.
+
+    Memory is measured in a separate run since tracing allocations skews timings. Every run writes to a new directory,
+    outputs left by an earlier run would make write_if_changed skip the write.
+    """
+    stages = dict.fromkeys(STAGES, 0.0)
+    pages = reps = 0
+    peak = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, load_xml in documents:
+            # pdftohtml is slow and deterministic, run it once and time it once
+            start = perf_counter()
+            xml = load_xml()
+            stages["pdftohtml"] += perf_counter() - start
+            best = {}
+            for _ in range(repeat):
+                timings, doc_pages, doc_reps = bench_document(lambda: xml, Path(tempfile.mkdtemp(dir=tmp_dir)))
+                for stage, seconds in timings.items():
+                    best[stage] = min(seconds, best.get(stage, seconds))
+            for stage in STAGES[1:]:
+                stages[stage] += best[stage]
+            pages += doc_pages
+            reps += doc_reps
+            if memory:
+                peak = max(peak, peak_memory(lambda: xml, Path(tempfile.mkdtemp(dir=tmp_dir))))
+
+    total = sum(stages.values())
+    return {
+        "documents": [name for name, _ in documents],
+        "pages": pages,
+        "reps": reps,
+        "stages": stages,
+        "total": total,
+        "pages_per_second": pages / total if total else None,
+        "reps_per_second": reps / total if total else None,
+        "peak_memory": peak if memory else None,
+    }
+
+
+def regressions(result, baseline, threshold=DEFAULT_THRESHOLD):
+    """Descriptions of stages (and peak memory) that are more than threshold slower (larger) than baseline"""
+    found = []
+    for stage, seconds in baseline["stages"].items():
+        if seconds < MIN_STAGE_SECONDS or stage not in result["stages"]:
+            continue
+        if result["stages"][stage] > seconds * (1 + threshold):
+            found.append(f"{stage}: {result['stages'][stage]:.3f}s, baseline {seconds:.3f}s")
+    if result.get("peak_memory") and baseline.get("peak_memory"):
+        if result["peak_memory"] > baseline["peak_memory"] * (1 + threshold):
+            found.append(f"peak_memory: {result['peak_memory']} bytes, baseline {baseline['peak_memory']} bytes")
+    return found
+
+
+def print_result(result):
+    print(f"{len(result['documents'])} documents, {result['pages']} pages, {result['reps']} reps")
+    for stage, seconds in result["stages"].items():
+        share = seconds / result["total"] * 100 if result["total"] else 0
+        print(f"  {stage:<12} {seconds:8.3f}s {share:5.1f}%")
+    print(f"  {'total':<12} {result['total']:8.3f}s")
+    if result["total"]:
+        print(f"{result['pages_per_second']:.1f} pages/s, {result['reps_per_second']:.1f} reps/s")
+    if result["peak_memory"] is not None:
+        print(f"peak memory {result['peak_memory'] / 1024 / 1024:.1f} MB")
+
+
+def parse_cli_args():
+    p = argparse.ArgumentParser(description="Benchmark the parser stages over the PDF corpus and test fixture")
+    p.add_argument("--corpus", choices=("all", "pdfs", "fixture"), default="all", help="Documents to benchmark")
+    p.add_argument("--repeat", type=int, default=3, help="Runs per document, the fastest run counts")
+    p.add_argument("--no-memory", action="store_true", default=False, help="Skip peak memory measurement")
+    p.add_argument("--baseline", default=str(BENCHMARK_BASELINE_PATH), help="Baseline file")
+    p.add_argument("--save-baseline", action="store_true", default=False, help="Save results as the new baseline")
+    p.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown vs baseline, e.g. 0.25 for 25%%"
+    )
+
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_cli_args()
+    baseline_path = Path(args.baseline)
+    result = run_benchmark(corpus_documents(args.corpus), repeat=args.repeat, memory=not args.no_memory)
+    print_result(result)
+
+    if args.save_baseline:
+        write_json(baseline_path, result)
+        print(f"Saved baseline to {baseline_path}")
+        sys.exit(0)
+
+    baseline = read_json(baseline_path)
+    if baseline is None:
+        print(f"No baseline in {baseline_path}, run with --save-baseline")
+    elif baseline["documents"] != result["documents"]:
+        print(f"Baseline in {baseline_path} is for other documents, not comparing")
+    else:
+        found = regressions(result, baseline, args.threshold)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if found else 0)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from pathlib import Path
+
+from settings import CHECKSUM_INDEX_PATH
+from utils import file_checksum, read_json, write_json
+
+
+class ChecksumIndex:
+    """
+    Persistent map of file path -> sha1, invalidated when a file's size or mtime changes.
+
+    Lets repeated runs compare archived PDFs without reading them again.
+    """
+
+    def __init__(self, path: Path = CHECKSUM_INDEX_PATH, entries=None):
+        self.path = path
+        self.entries = entries if entries is not None else read_json(path, default={})
+
+    @staticmethod
+    def key(file_path):
+        return str(Path(file_path).resolve())
+
+    def checksum(self, file_path):
+        file_path = Path(file_path)
+        stat = file_path.stat()
+        entry = self.entries.get(self.key(file_path))
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha1"]
+
+        sha1 = file_checksum(file_path)
+        self.update(file_path, sha1)
+        return sha1
+
+    def update(self, file_path, sha1):
+        """Store a checksum computed elsewhere, e.g. while downloading file_path"""
+        stat = Path(file_path).stat()
+        self.entries[self.key(file_path)] = {"sha1": sha1, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_json(self.path, dict(sorted(self.entries.items())))
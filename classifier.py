@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import re
+from array import array
+from itertools import compress
+
+REP_HEADER = 1
+CATEGORY = 2
+INTEREST = 3
+CATEGORY_CONTINUATION = 4  # rest of a hyphenated category name
+
+REP_PATTERN = re.compile(r"(?P<full_name>[-\w,. ]+)\(((?P<rep_number>\d+), )?(?P<party>\w+),? ?([-,\w\s]+)?\)")
+SECTION_PATTERN = re.compile(r"§\s*(?P<number>\d+)\.?\s*(?P<name>.*)")
+
+
+def normalize_category(text):
+    """Normalize category name for lookup, e.g. "Lønnet stilling m.v." and "Lønnet stilling mv." are the same"""
+    text = text.lower().replace("m.v.", "mv")
+    return " ".join(text.replace(".", " ").split())
+
+
+def category_variants(name):
+    """Spellings of a category name seen in the registers"""
+    variants = {name, name.replace("mv.", "m.v."), name.replace("m.v.", "mv.")}
+    return variants | {variant.rstrip(".") for variant in variants}
+
+
+class LineClassifier:
+    """
+    Classify text runs on representative pages as rep header, category or interest text.
+
+    Built once per document with precompiled patterns and a normalized category table. Runs are classified page by
+    page over the columnar DocumentLayout: column positions of each page come from histograms of left positions,
+    pages without category markers keep the columns of the previous page.
+    """
+
+    def __init__(self, categories, category_col, interest_col, non_rep_headers=(), page_separator=None):
+        self.categories = categories
+        self.category_lookup = {normalize_category(name): key for key, name in categories.items()}
+        self.category_table = {variant: key for key, name in categories.items() for variant in category_variants(name)}
+        self._markers = {}
+        self.non_rep_headers = set(non_rep_headers)
+        self.page_separator = page_separator
+        self.category_col = category_col
+        self.interest_col = interest_col
+
+    def section(self, content):
+        """Category key of a "§<n> <name>" marker, None if content is not a marker"""
+        if not content.startswith("§"):
+            return None
+        m = SECTION_PATTERN.match(content)
+        if not m:
+            return None
+        if m.group("number") in self.categories:
+            return m.group("number")
+        return self.category_lookup.get(normalize_category(m.group("name")))
+
+    def is_category_marker(self, content):
+        marker = self._markers.get(content)
+        if marker is None:
+            marker = self._markers[content] = content in self.category_table or self.section(content) is not None
+        return marker
+
+    def detect_columns(self, layout, page_idx, markers, page_numbers):
+        """
+        Set the category and interest column from the page's histograms of the left positions of category markers and
+        of interest text candidates, pages without category markers keep the columns of the previous page
+        """
+        if not any(markers):
+            return
+        start, end = layout.page_range(page_idx)
+        self.category_col = category_col = min(compress(layout.left[start:end], markers))
+        separator = self.page_separator
+        candidates = bytearray(
+            [
+                not bold and not page_number and not marker and len(content) > 1 and content != separator
+                for content, bold, page_number, marker in zip(
+                    layout.text[start:end], layout.bold[start:end], page_numbers, markers
+                )
+            ]
+        )
+        cols = [(left, count) for left, count in layout.histogram(page_idx, candidates).items() if left > category_col]
+        if cols:
+            self.interest_col = max(cols, key=lambda left_count: left_count[1])[0]
+
+    def classify_page(self, layout, page_idx):
+        """
+        Role of each run on page page_idx of layout: REP_HEADER, CATEGORY, CATEGORY_CONTINUATION, INTEREST or 0 for
+        runs to skip. The first run in the category column after a category run ending in "-" is its continuation.
+
+        Pages have to be classified in order, e.g. as they are appended to a layout being streamed.
+        """
+        start, end = layout.page_range(page_idx)
+        texts = layout.text[start:end]
+        page_numbers = layout.page_number_mask(page_idx)
+        markers = bytearray(map(self.is_category_marker, texts))
+        self.detect_columns(layout, page_idx, markers, page_numbers)
+        category_col = self.category_col
+        interest_col = self.interest_col
+        non_rep_headers = self.non_rep_headers
+
+        roles = array("b", bytes(end - start))
+        continues_category = False
+        runs = zip(layout.bold[start:end], texts, layout.left[start:end], page_numbers, markers)
+        for idx, (bold, content, left, page_number, marker) in enumerate(runs):
+            if bold and bold not in non_rep_headers:
+                roles[idx] = REP_HEADER
+                continues_category = False
+            elif not content:
+                continue
+            elif continues_category and left == category_col and not page_number:
+                # runs come line by line, interest text on the line of the first part comes before the rest
+                roles[idx] = CATEGORY_CONTINUATION
+                continues_category = False
+            elif (left == category_col and not page_number) or (marker and content[0] == "§"):
+                roles[idx] = CATEGORY
+                continues_category = content[-1] == "-"
+            elif left == interest_col:
+                roles[idx] = INTEREST
+        return roles
+
+    def category_key(self, content, next_content=None):
+        """
+        Category key for category run content, defaults to "1" when the category is not recognized. next_content is
+        the continuation of a hyphenated category name, without it the name is completed from the category names.
+        """
+        # Handle hyphenated categories
+        if content.endswith("-"):
+            prefix = content[:-1]
+            if next_content is not None:
+                content = f"{prefix}{next_content}"
+            else:
+                # hyphenated over a page break, complete from the category names
+                normalized_prefix = normalize_category(prefix)
+                matches = [name for name in self.category_lookup if name.startswith(normalized_prefix)]
+                if len(matches) == 1:
+                    return self.category_lookup[matches[0]]
+
+        if content in self.category_table:
+            return self.category_table[content]
+        section = self.section(content)
+        if section is not None:
+            return section
+        return self.category_lookup.get(normalize_category(content), "1")
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from pytest import fixture
+
+import settings
+
+# settings paths each module writes to, as imported into the module
+OUTPUT_PATHS = {
+    "parser": (
+        "PDF_DIR",
+        "DATA_DIR",
+        "DATABASE_PATH",
+        "MANIFEST_PATH",
+        "ARCHIVE_DIR",
+        "SEARCH_INDEX_PATH",
+        "TIMELINES_DIR",
+    ),
+    "scraper": ("CHECKSUM_INDEX_PATH", "MANIFEST_PATH"),
+    "update": ("MANIFEST_PATH", "CHECKSUM_INDEX_PATH"),
+    "watch": ("MANIFEST_PATH",),
+}
+
+
+class StandInSite:
+    """
+    Local stand-in for stortinget.no serving `pages` (path -> bytes) and recording requests
+
+    Responses carry an ETag and answer If-None-Match with 304 Not Modified. Bodies of paths in `broken` are cut off
+    halfway, after the headers of the full body.
+    """
+
+    def __init__(self):
+        self.pages = {}
+        self.broken = set()
+        self.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.requests.append((self.path, dict(self.headers)))
+                body = site.pages.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body[: len(body) // 2] if self.path in site.broken else body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@fixture
+def stand_in_site():
+    site = StandInSite()
+    thread = threading.Thread(target=site.server.serve_forever, daemon=True)
+    thread.start()
+    yield site
+    site.server.shutdown()
+    site.server.server_close()
+
+
+@fixture
+def pdf_dict():
+    with Path("testdata.json").open() as fp:
+        return json.load(fp)
+
+
+@fixture
+def data_dir(tmp_path, monkeypatch):
+    """Redirect PDF_DIR, DATA_DIR and the other outputs of the modules in OUTPUT_PATHS to the same layout in tmp_path"""
+    for module, names in OUTPUT_PATHS.items():
+        for name in names:
+            monkeypatch.setattr(f"{module}.{name}", tmp_path.joinpath(getattr(settings, name)))
+    tmp_path.joinpath(settings.PDF_DIR).mkdir()
+    data_dir = tmp_path.joinpath(settings.DATA_DIR)
+    data_dir.mkdir()
+    return data_dir
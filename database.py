@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import sqlite3
+from pathlib import Path
+
+from archive import SnapshotArchive
+from settings import DATA_DIR, DATABASE_PATH
+from snapshots import normalize_reps, snapshot_date, snapshot_paths
+from utils import file_checksum
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    updated_at TEXT NOT NULL UNIQUE,
+    checksum TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS representatives (
+    id INTEGER PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    party TEXT NOT NULL,
+    UNIQUE (last_name, first_name, party)
+);
+CREATE TABLE IF NOT EXISTS categories (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot_reps (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    rep_id INTEGER NOT NULL REFERENCES representatives (id),
+    PRIMARY KEY (snapshot_id, rep_id)
+);
+CREATE TABLE IF NOT EXISTS interests (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    rep_id INTEGER NOT NULL REFERENCES representatives (id),
+    category_key TEXT NOT NULL REFERENCES categories (key),
+    text TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, rep_id, category_key)
+);
+CREATE INDEX IF NOT EXISTS representatives_party ON representatives (party);
+CREATE INDEX IF NOT EXISTS snapshot_reps_rep ON snapshot_reps (rep_id);
+CREATE INDEX IF NOT EXISTS interests_rep ON interests (rep_id, snapshot_id);
+CREATE INDEX IF NOT EXISTS interests_category ON interests (category_key, snapshot_id);
+"""
+
+
+class InterestsDatabase:
+    """
+    SQLite archive of all parsed snapshots, with tables for snapshots, representatives, categories and interest texts.
+
+    Snapshots are imported incrementally, a snapshot is only re-imported when its JSON file changed. The database is
+    derived from the snapshot files and kept out of the repository, `update` (re)builds it.
+    """
+
+    def __init__(self, path: Path = DATABASE_PATH):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path))
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.connection.commit()
+        self.connection.close()
+
+    def rep_id(self, rep):
+        party = rep["party"].lower()
+        self.connection.execute(
+            "INSERT OR IGNORE INTO representatives (first_name, last_name, party) VALUES (?, ?, ?)",
+            (rep["first_name"], rep["last_name"], party),
+        )
+        return self.connection.execute(
+            "SELECT id FROM representatives WHERE last_name = ? AND first_name = ? AND party = ?",
+            (rep["last_name"], rep["first_name"], party),
+        ).fetchone()[0]
+
+    def import_snapshot(self, path: Path, categories=None):
+        """Import snapshot JSON file, returns False if it is already imported and unchanged"""
+        updated_at_str = snapshot_date(path)
+        checksum = file_checksum(path)
+        row = self.connection.execute(
+            "SELECT checksum FROM snapshots WHERE updated_at = ?", (updated_at_str,)
+        ).fetchone()
+        if row and row[0] == checksum:
+            return False
+
+        with path.open() as f:
+            data = json.load(f)
+        categories = {
+            **(categories or {}),
+            **(data.get("_meta", {}).get("categories", {}) if isinstance(data, dict) else {}),
+        }
+        reps = normalize_reps(data, categories)
+
+        with self.connection:
+            self.connection.execute("DELETE FROM snapshots WHERE updated_at = ?", (updated_at_str,))
+            snapshot_id = self.connection.execute(
+                "INSERT INTO snapshots (updated_at, checksum) VALUES (?, ?)", (updated_at_str, checksum)
+            ).lastrowid
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO categories (key, name) VALUES (?, ?)", list(categories.items())
+            )
+            for rep in reps:
+                rep_id = self.rep_id(rep)
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO snapshot_reps (snapshot_id, rep_id) VALUES (?, ?)", (snapshot_id, rep_id)
+                )
+                for category_key, text in rep["by_category"].items():
+                    # legacy snapshots can have categories outside of categories, e.g. "Ingen registrerte opplysninger"
+                    self.connection.execute(
+                        "INSERT OR IGNORE INTO categories (key, name) VALUES (?, ?)", (category_key, category_key)
+                    )
+                    self.connection.execute(
+                        "INSERT OR IGNORE INTO interests (snapshot_id, rep_id, category_key, text) VALUES (?, ?, ?, ?)",
+                        (snapshot_id, rep_id, category_key, text),
+                    )
+        return True
+
+    def is_empty(self):
+        return self.connection.execute("SELECT 1 FROM snapshots LIMIT 1").fetchone() is None
+
+    def update(self, data_dir: Path = DATA_DIR, categories=None):
+        """Import new and changed snapshots in data_dir, returns number of imported snapshots"""
+        return sum(self.import_snapshot(path, categories) for path in snapshot_paths(data_dir))
+
+    def rep_interests(self, last_name, first_name=None, category=None):
+        """(updated_at, first_name, last_name, party, category, text) rows for matching reps, oldest first"""
+        query = """
+            SELECT s.updated_at, r.first_name, r.last_name, r.party, c.name, i.text
+            FROM interests i
+            JOIN snapshots s ON s.id = i.snapshot_id
+            JOIN representatives r ON r.id = i.rep_id
+            JOIN categories c ON c.key = i.category_key
+            WHERE r.last_name = ?
+        """
+        params = [last_name]
+        if first_name:
+            query += " AND r.first_name = ?"
+            params.append(first_name)
+        if category:
+            query += " AND (c.key = ? OR c.name = ?)"
+            params += [category, category]
+        return self.connection.execute(query + " ORDER BY s.updated_at, c.key", params).fetchall()
+
+    def party_totals(self, category=None):
+        """(updated_at, party, category, number of reps) rows, oldest first"""
+        query = """
+            SELECT s.updated_at, r.party, c.name, COUNT(DISTINCT i.rep_id)
+            FROM interests i
+            JOIN snapshots s ON s.id = i.snapshot_id
+            JOIN representatives r ON r.id = i.rep_id
+            JOIN categories c ON c.key = i.category_key
+        """
+        params = []
+        if category:
+            query += " WHERE c.key = ? OR c.name = ?"
+            params += [category, category]
+        query += " GROUP BY s.updated_at, r.party, c.key ORDER BY s.updated_at, r.party, c.key"
+        return self.connection.execute(query, params).fetchall()
+
+
+def parse_cli_args():
+    p = argparse.ArgumentParser(description="Query the SQLite archive of parsed snapshots")
+    p.add_argument(
+        "--update",
+        action="store_true",
+        default=False,
+        help="Import new and changed snapshots, an empty database is always filled",
+    )
+    p.add_argument("--rep", help='Interests of representative, "Last name" or "Last name, First name"')
+    p.add_argument("--party-totals", action="store_true", default=False, help="Reps per party and category over time")
+    p.add_argument("--category", help="Limit to category key or name")
+
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    from parser import InterestParser
+
+    args = parse_cli_args()
+    with InterestsDatabase() as db:
+        if args.update or db.is_empty():
+            SnapshotArchive().restore_missing()
+            print(f"Imported {db.update(categories=InterestParser.INTEREST_CATS)} snapshots")
+        rows = []
+        if args.rep:
+            last_name, _, first_name = args.rep.partition(",")
+            rows = db.rep_interests(last_name.strip(), first_name.strip(), args.category)
+        elif args.party_totals:
+            rows = db.party_totals(args.category)
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False))
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import json
+from pathlib import Path
+
+from settings import DATA_DIR, CHANGES_DIR_NAME, CHANGELOG_FILE_NAME
+from snapshots import index_reps, load_snapshot, next_snapshot_path, previous_snapshot_path, snapshot_date
+from utils import write_if_changed, write_json
+
+
+def rep_dict(key):
+    last_name, first_name, party = key
+    return {"first_name": first_name, "last_name": last_name, "party": party}
+
+
+def diff_reps(old_reps, new_reps):
+    """Reps added/removed and category texts added/removed/modified per rep between two snapshots"""
+    old_index = index_reps(old_reps)
+    new_index = index_reps(new_reps)
+
+    changed = []
+    for key in sorted(old_index.keys() & new_index.keys()):
+        old_cats, new_cats = old_index[key], new_index[key]
+        added = {cat: new_cats[cat] for cat in new_cats.keys() - old_cats.keys()}
+        removed = {cat: old_cats[cat] for cat in old_cats.keys() - new_cats.keys()}
+        modified = {
+            cat: {"old": old_cats[cat], "new": new_cats[cat]}
+            for cat in old_cats.keys() & new_cats.keys()
+            if old_cats[cat] != new_cats[cat]
+        }
+        if added or removed or modified:
+            changed.append(
+                {
+                    **rep_dict(key),
+                    "added": dict(sorted(added.items())),
+                    "removed": dict(sorted(removed.items())),
+                    "modified": dict(sorted(modified.items())),
+                }
+            )
+
+    return {
+        "added": [
+            {**rep_dict(key), "by_category": new_index[key]} for key in sorted(new_index.keys() - old_index.keys())
+        ],
+        "removed": [rep_dict(key) for key in sorted(old_index.keys() - new_index.keys())],
+        "changed": changed,
+    }
+
+
+def summarize_changes(changes, categories=None):
+    """Lines with one rep per line, "+" added, "-" removed and "~" changed with the names of changed categories"""
+    categories = categories or {}
+
+    def name(rep):
+        return f"{rep['last_name']}, {rep['first_name']} ({rep['party']})"
+
+    lines = [f"+ {name(rep)}" for rep in changes["added"]]
+    lines += [f"- {name(rep)}" for rep in changes["removed"]]
+    for rep in changes["changed"]:
+        kinds = [
+            f"{kind} {', '.join(categories.get(cat, cat) for cat in rep[kind])}"
+            for kind in ("added", "removed", "modified")
+            if rep[kind]
+        ]
+        lines.append(f"~ {name(rep)}: {'; '.join(kinds)}")
+    return lines
+
+
+def write_changes(updated_at_str, reps, categories=None, data_dir: Path = DATA_DIR):
+    """
+    Diff reps against the previous snapshot in data_dir and write changes/changes-<date>.json
+
+    A snapshot saved before newer ones also has the change file of the next snapshot diffed against it again, so
+    registers parsed out of order end up with the same change files as an in order run. Returns the change file path,
+    None if there is no previous snapshot.
+    """
+    changes_path = None
+    previous_path = previous_snapshot_path(updated_at_str, data_dir)
+    if previous_path is not None:
+        previous_reps = load_snapshot(previous_path, categories)
+        changes_path = write_change_file(snapshot_date(previous_path), previous_reps, updated_at_str, reps, data_dir)
+
+    next_path = next_snapshot_path(updated_at_str, data_dir)
+    if next_path is not None:
+        write_change_file(
+            updated_at_str, reps, snapshot_date(next_path), load_snapshot(next_path, categories), data_dir
+        )
+
+    return changes_path
+
+
+def write_change_file(from_date, old_reps, to_date, new_reps, data_dir: Path = DATA_DIR):
+    """Write the changes from old_reps to new_reps to changes/changes-<to_date>.json and its changelog line"""
+    changes = diff_reps(old_reps, new_reps)
+    changes_dir = data_dir.joinpath(CHANGES_DIR_NAME)
+    changes_dir.mkdir(parents=True, exist_ok=True)
+    changes_path = changes_dir.joinpath(f"changes-{to_date}.json")
+    write_json(changes_path, {"from": from_date, "to": to_date, **changes})
+    summary = {
+        "from": from_date,
+        "to": to_date,
+        "added": len(changes["added"]),
+        "removed": len(changes["removed"]),
+        "changed": len(changes["changed"]),
+        "file": changes_path.name,
+    }
+    update_changelog(changes_dir.joinpath(CHANGELOG_FILE_NAME), summary)
+    return changes_path
+
+
+def update_changelog(changelog_path: Path, summary):
+    """Set the summary line of a change file in changelog_path, one JSON line per change file in date order"""
+    summaries = {}
+    if changelog_path.exists():
+        for line in changelog_path.read_text(encoding="utf-8").splitlines():
+            line_summary = json.loads(line)
+            summaries[line_summary["to"]] = line_summary
+    summaries[summary["to"]] = summary
+    lines = [json.dumps(summaries[to_date], ensure_ascii=False) + "\n" for to_date in sorted(summaries)]
+    return write_if_changed(changelog_path, "".join(lines).encode("utf-8"))
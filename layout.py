@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from array import array
+from collections import Counter
+from itertools import chain, compress, repeat
+
+from models import Page, page_texts, text_value
+
+
+class DocumentLayout:
+    """
+    Text runs of a document in columnar form: an array of left positions and lists of bold and plain text, all
+    indexed by run. page_starts holds the index of the first run of each page.
+
+    Pages are appended one at a time, so streamed pages are only kept as these arrays and can be classified as they
+    arrive.
+    """
+
+    def __init__(self, pages=()):
+        self.page_numbers = array("i")
+        self.page_starts = array("i")
+        self.left = array("i")
+        self.bold = []
+        self.text = []
+        for page in pages:
+            self.append(page)
+
+    def __len__(self):
+        return len(self.text)
+
+    @property
+    def num_pages(self):
+        return len(self.page_numbers)
+
+    def append(self, page):
+        """Append the runs of a Page or of an xmltodict page, the latter without building TextRun tuples"""
+        self.page_starts.append(len(self.text))
+        if isinstance(page, Page):
+            self.page_numbers.append(page.number)
+            if page.texts:
+                # transpose the page's runs (TextRun fields) to columns
+                _, left, _, _, _, text, bold = zip(*page.texts)
+                self.left.extend(left)
+                self.bold.extend(bold)
+                self.text.extend(text)
+            return
+
+        texts = page_texts(page)
+        self.page_numbers.append(int(page["@number"]))
+        self.left.extend([int(text["@left"]) for text in texts])
+        self.bold.extend([text_value(text.get("b")) for text in texts])
+        self.text.extend([text_value(text.get("#text")) for text in texts])
+
+    def page_range(self, page_idx):
+        """(start, end) run index range of page page_idx"""
+        end = self.page_starts[page_idx + 1] if page_idx + 1 < self.num_pages else len(self)
+        return self.page_starts[page_idx], end
+
+    def page_ranges(self):
+        """(start, end) run index range of each page"""
+        return list(zip(self.page_starts, chain(self.page_starts[1:], [len(self)])))
+
+    def page_lengths(self):
+        """Number of runs on each page"""
+        return [end - start for start, end in self.page_ranges()]
+
+    def per_run(self, page_values):
+        """Spread one value per page to one value per run"""
+        return list(chain.from_iterable(map(repeat, page_values, self.page_lengths())))
+
+    def run_pages(self):
+        """Page index of each run"""
+        return array("i", self.per_run(range(self.num_pages)))
+
+    def page_number_mask(self, page_idx):
+        """Runs of page page_idx with its page number as text"""
+        start, end = self.page_range(page_idx)
+        label = str(self.page_numbers[page_idx])
+        mask = bytearray(end - start)
+        text = self.text
+        idx = start
+        while True:
+            try:
+                idx = text.index(label, idx, end)
+            except ValueError:
+                return mask
+            mask[idx - start] = 1
+            idx += 1
+
+    def histogram(self, page_idx, mask):
+        """Counter of left positions of the masked runs of page page_idx"""
+        start, end = self.page_range(page_idx)
+        return Counter(compress(self.left[start:end], mask))
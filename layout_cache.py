@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from settings import LAYOUT_CACHE_DIR, LAYOUT_CACHE_MAX_BYTES
+from utils import file_checksum, poppler_version
+
+
+class LayoutCache:
+    """
+    On-disk cache of pdftohtml output, keyed by PDF checksum and poppler version.
+
+    Entries are gzipped compact JSON of the dict pdf_to_xml_dict returns. Total size is bounded by max_bytes, least
+    recently used entries are evicted first.
+    """
+
+    SUFFIX = ".json.gz"
+
+    def __init__(self, cache_dir: Path = LAYOUT_CACHE_DIR, max_bytes=LAYOUT_CACHE_MAX_BYTES, checksum_index=None):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.checksum_index = checksum_index
+
+    def key(self, pdf_path):
+        """Cache key of a PDF file, or of PDF content given as bytes"""
+        if isinstance(pdf_path, bytes):
+            checksum = hashlib.sha1(pdf_path).hexdigest()
+        elif self.checksum_index is not None:
+            checksum = self.checksum_index.checksum(pdf_path)
+        else:
+            checksum = file_checksum(Path(pdf_path))
+        return f"{checksum}-{poppler_version()}"
+
+    def entry_path(self, key):
+        return self.cache_dir.joinpath(f"{key}{self.SUFFIX}")
+
+    def get(self, key):
+        path = self.entry_path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                pdf_dict = json.load(f)
+        except (FileNotFoundError, EOFError, OSError, ValueError):
+            return None
+
+        os.utime(path)  # mark as recently used
+        return pdf_dict
+
+    def put(self, key, pdf_dict):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("wb", dir=self.cache_dir, suffix=".tmp", delete=False) as f:
+            with gzip.GzipFile(fileobj=f, mode="wb") as gz:
+                gz.write(json.dumps(pdf_dict, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        Path(f.name).replace(self.entry_path(key))
+        self.evict()
+
+    def entries(self):
+        if not self.cache_dir.exists():
+            return []
+        return sorted(self.cache_dir.glob(f"*{self.SUFFIX}"), key=lambda path: path.stat().st_mtime)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes, always keeping the newest"""
+        entries = self.entries()
+        total = sum(path.stat().st_size for path in entries)
+        for path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink()
+
+    def clear(self):
+        for path in self.entries():
+            path.unlink()
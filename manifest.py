@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from pathlib import Path
+
+from utils import file_checksum, read_json, write_json
+
+
+class ParseManifest:
+    """
+    Persistent map of PDF checksum -> parser version and produced outputs.
+
+    Lets `parser.py --all` skip PDFs that were already parsed by the current parser version.
+    """
+
+    def __init__(self, path: Path, parser_version, entries=None, checksum_index=None):
+        self.path = path
+        self.parser_version = parser_version
+        self.entries = entries or {}
+        self.checksum_index = checksum_index
+        self._checksums = {}
+
+    @classmethod
+    def load(cls, path: Path, parser_version, checksum_index=None):
+        entries = read_json(path, default={}).get("files", {})
+        return cls(path, parser_version, entries, checksum_index=checksum_index)
+
+    def save(self):
+        write_json(self.path, {"files": dict(sorted(self.entries.items()))})
+
+    def checksum(self, pdf_path: Path):
+        key = str(pdf_path)
+        if key not in self._checksums:
+            if self.checksum_index is not None:
+                self._checksums[key] = self.checksum_index.checksum(pdf_path)
+            else:
+                self._checksums[key] = file_checksum(Path(pdf_path))
+        return self._checksums[key]
+
+    def lookup(self, pdf_path: Path):
+        """Return manifest entry if pdf_path is unchanged and its outputs are current, else None"""
+        entry = self.entries.get(self.checksum(pdf_path))
+        if not entry or entry["parser_version"] != self.parser_version:
+            return None
+        if not all(Path(output).exists() for output in entry["outputs"]):
+            return None
+        return entry
+
+    def record(self, pdf_path: Path, updated_at_str, outputs):
+        self.entries[self.checksum(pdf_path)] = {
+            "pdf": Path(pdf_path).name,
+            "parser_version": self.parser_version,
+            "updated_at": updated_at_str,
+            "outputs": [str(output) for output in outputs],
+        }
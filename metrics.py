@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import cProfile
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from time import perf_counter
+
+
+class Metrics:
+    """
+    Stage timings and counters of a parse run, in total and per document.
+
+    Parsers use NULL_METRICS unless metrics are requested, so disabled instrumentation is a no-op method call per
+    stage. Counters in the hot loop are plain locals reported once per document.
+    """
+
+    enabled = True
+
+    def __init__(self, profile=False):
+        self.stages = {}
+        self.counters = Counter()
+        self.documents = []
+        self.current = None
+        self.profiler = cProfile.Profile() if profile else None
+
+    @contextmanager
+    def stage(self, name, profile=False):
+        """Time a stage, profile=True also runs it under cProfile if profiling is enabled"""
+        profiler = self.profiler if profile else None
+        start = perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            self.add_stage(name, perf_counter() - start)
+
+    def add_stage(self, name, seconds, calls=1):
+        stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+        stage["seconds"] += seconds
+        stage["calls"] += calls
+        if self.current is not None:
+            self.current["stages"][name] = self.current["stages"].get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+        if self.current is not None:
+            self.current["counters"][name] = self.current["counters"].get(name, 0) + n
+
+    def begin_document(self, pdf_path):
+        self.current = {"pdf": str(pdf_path), "stages": {}, "counters": {}}
+        self.documents.append(self.current)
+
+    def end_document(self, **fields):
+        if self.current is not None:
+            self.current.update(fields)
+        self.current = None
+
+    def merge(self, data):
+        """Add metrics collected in another process, see as_dict"""
+        for name, stage in data["stages"].items():
+            self.add_stage(name, stage["seconds"], stage["calls"])
+        for name, n in data["counters"].items():
+            self.count(name, n)
+        self.documents += data["documents"]
+
+    def as_dict(self):
+        return {"stages": self.stages, "counters": dict(self.counters), "documents": self.documents}
+
+    def dump_profile(self, path: Path):
+        if self.profiler:
+            self.profiler.dump_stats(str(path))
+
+
+class NullMetrics:
+    """Disabled metrics"""
+
+    enabled = False
+    _null_stage = nullcontext()
+
+    def stage(self, name, profile=False):
+        return self._null_stage
+
+    def add_stage(self, name, seconds, calls=1):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def begin_document(self, pdf_path):
+        pass
+
+    def end_document(self, **fields):
+        pass
+
+    def merge(self, data):
+        pass
+
+
+NULL_METRICS = NullMetrics()
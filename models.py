@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from typing import NamedTuple, Tuple
+
+
+def text_value(value):
+    """Plain string of an xmltodict text value, which can be None, a string, a nested dict or a list"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return text_value(value.get("#text"))
+    return " ".join(text_value(item) for item in value)
+
+
+def element_text(element):
+    """Stripped text of an ElementTree element excluding its children, like #text from xmltodict"""
+    return ((element.text or "") + "".join(child.tail or "" for child in element)).strip()
+
+
+def page_texts(page):
+    """Text run dicts of an xmltodict page"""
+    texts = page.get("text") or []
+    return [texts] if isinstance(texts, dict) else texts
+
+
+class TextRun(NamedTuple):
+    """A positioned run of text from pdftohtml, coordinates in pixels"""
+
+    top: int
+    left: int
+    width: int
+    height: int
+    font: int
+    text: str  # plain text, empty if none
+    bold: str  # bold text, empty if the run is not bold
+
+    @classmethod
+    def from_dict(cls, text):
+        return cls(
+            int(text["@top"]),
+            int(text["@left"]),
+            int(text["@width"]),
+            int(text["@height"]),
+            int(text["@font"]),
+            text_value(text.get("#text")),
+            text_value(text.get("b")),
+        )
+
+    @classmethod
+    def from_element(cls, element):
+        attrib = element.attrib
+        return cls(
+            int(attrib["top"]),
+            int(attrib["left"]),
+            int(attrib["width"]),
+            int(attrib["height"]),
+            int(attrib["font"]),
+            element_text(element),
+            " ".join(element_text(bold) for bold in element.findall("b")),
+        )
+
+
+class Page(NamedTuple):
+    number: int
+    texts: Tuple[TextRun, ...]
+
+    @classmethod
+    def from_dict(cls, page):
+        return cls(int(page["@number"]), tuple(TextRun.from_dict(text) for text in page_texts(page)))
+
+    @classmethod
+    def from_element(cls, element):
+        return cls(int(element.attrib["number"]), tuple(TextRun.from_element(text) for text in element.iter("text")))
+
+
+def as_page(page):
+    """Adapt an xmltodict page (e.g. from testdata.json or pdf_to_xml_dict) to Page, Page instances pass through"""
+    return page if isinstance(page, Page) else Page.from_dict(page)
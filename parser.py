@@ -2,6 +2,9 @@
 # -*- coding: utf-8 -*-
 import argparse
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, compress
 from pathlib import Path
 from pprint import pprint
 
@@ -10,8 +13,39 @@ import shutil
 from collections import OrderedDict
 from datetime import datetime
 
-from settings import PDF_DIR, DATA_DIR
-from utils import write_csv, write_json, pdf_to_xml_dict, MONTHS_NB
+from archive import SnapshotArchive
+from checksum_index import ChecksumIndex
+from classifier import LineClassifier, REP_PATTERN, REP_HEADER, CATEGORY, CATEGORY_CONTINUATION, INTEREST
+from database import InterestsDatabase
+from diff import diff_reps, summarize_changes, write_changes
+from layout import DocumentLayout
+from layout_cache import LayoutCache
+from manifest import ParseManifest
+from metrics import Metrics, NULL_METRICS
+from models import as_page
+from search import SearchIndex
+from settings import (
+    PDF_DIR,
+    DATA_DIR,
+    ARCHIVE_DIR,
+    DATABASE_PATH,
+    MANIFEST_PATH,
+    PAGE_INDEX_DIR_NAME,
+    SEARCH_INDEX_PATH,
+    TIMELINES_DIR,
+)
+from snapshots import REP_FIELDS, load_snapshot
+from timelines import Timelines
+from utils import (
+    dumps_json,
+    read_json,
+    write_csv,
+    write_json,
+    write_json_gz,
+    pdf_to_xml_dict,
+    iter_pdf_pages,
+    MONTHS_NB,
+)
 
 
 class InterestParser:
@@ -21,6 +55,9 @@ class InterestParser:
     https://www.stortinget.no/no/Stortinget-og-demokratiet/Representantene/Okonomiske-interesser/
     """
 
+    # Bump when a parser change alters output, invalidates the parse manifest
+    PARSER_VERSION = "1"
+
     REP_URL = "https://www.stortinget.no/globalassets/pdf/verv_oekonomiske_interesser_register/verv_ok_interesser.pdf"
 
     NO_REP_TEXTS = ["Ingen registrerte opplysninger", "Ingen mottatte opplysninger"]
@@ -43,176 +80,262 @@ class InterestParser:
             "98": "Andre forhold",
         }
     )
-    CAT_INDEX = {
-        **{val: key for key, val in INTEREST_CATS.items()},
-        "Lønnet stilling m.v.": "4",  # FIXME: use regex
-        "Aksjer m.v.": "9",  # FIXME: use regex
-    }
-
-    pdf_dict = {}
-
-    def __init__(self, pdf_dict=None, verbose=False):
+    NON_REP_HEADERS = [
+        "Representanter",
+        "Regjeringsmedlemmer",
+        "Vararepresentanter",
+    ]
+
+    def __init__(
+        self,
+        pdf_dict=None,
+        verbose=False,
+        stream=False,
+        layout_cache=None,
+        checksum_index=None,
+        metrics=None,
+        json_gz=False,
+        shards=1,
+    ):
         self.verbose = verbose
         self.pdf_dict = pdf_dict
-
-    def parse_document_meta(self):
-        first_page_texts = self.pdf_dict["pdf2xml"]["page"][0]["text"]
+        self.stream = stream
+        self.layout_cache = layout_cache
+        self.checksum_index = checksum_index
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.json_gz = json_gz
+        self.shards = shards
+        self.files_written = 0
+        self.files_unchanged = 0
+        self.page_index = None
+        self._archive = None
+        self._search_index = None
+        self._timelines = None
+
+    @property
+    def page_dicts(self):
+        """xmltodict pages of pdf_dict"""
+        return self.pdf_dict["pdf2xml"]["page"]
+
+    def extract_pages(self, pdf_path):
+        """Iterate PDF pages, either streamed from pdftohtml (bypasses layout cache) or from a fully parsed pdf_dict"""
+        if self.stream:
+            return iter_pdf_pages(pdf_path, model=True)
+
+        self.pdf_dict = pdf_to_xml_dict(pdf_path, cache=self.layout_cache, metrics=self.metrics, shards=self.shards)
+        return iter(self.page_dicts)
+
+    def parse_document_meta(self, first_page=None):
+        if first_page is None:
+            first_page = self.page_dicts[0]
+        first_page_texts = as_page(first_page).texts
         marker = "Ajourført"
-        updated_at = [text for text in first_page_texts if marker in text.get("#text", "")][0]["#text"]
+        updated_at = [text for text in first_page_texts if marker in text.text][0].text
         return {"updated_at": self.last_updated_date(updated_at)}
 
-    def first_page_with_rep_data(self):
-        for i, page in enumerate(self.pdf_dict["pdf2xml"]["page"]):
-            texts = page["text"]
-            for text in texts:
-                bold_text = (text.get("b", "") or "").strip()
-                text_plain = (text.get("#text", "") or "").strip()
-                if bold_text == "Representanter":
-                    return i
-                elif text_plain == "Representanter":
-                    return i
+    def probe_document_meta(self, pdf_path):
+        """Read document meta from the first page only, without extracting the whole PDF (path or PDF bytes)"""
+        pdf_dict = pdf_to_xml_dict(pdf_path, first_page=1, last_page=1)
+        return self.parse_document_meta(pdf_dict["pdf2xml"]["page"][0])
+
+    def parse_bytes(self, pdf_bytes):
+        """
+        Parse PDF content given as bytes, returns (meta, reps)
+
+        The PDF is piped to pdftohtml, nothing is written to disk except the layout cache entry if a cache is set.
+        """
+        metrics = self.metrics
+        with metrics.stage("extract"):
+            self.pdf_dict = pdf_to_xml_dict(pdf_bytes, cache=self.layout_cache, metrics=metrics, shards=self.shards)
+        with metrics.stage("meta"):
+            meta = self.parse_document_meta()
+        with metrics.stage("parse", profile=True):
+            reps = self.parse_pdf_data()
+        return meta, reps
+
+    def next_page_with_rep_data(self, pages):
+        """Consume page iterator up to and including the first page with representative data, returned as Page"""
+        for page in map(as_page, pages):
+            if self.has_rep_heading(page):
+                return page
         raise ValueError("Could not find page with representative heading")
 
+    @staticmethod
+    def has_rep_heading(page):
+        for text in page.texts:
+            if text.bold.strip() == "Representanter":
+                return True
+            elif text.text.strip() == "Representanter":
+                return True
+        return False
+
     def find_y_coords(self, first_page):
-        category_coord = "106"  # FIXME: can be more than one coord
-        interest_coord = "319"
-        for text in first_page["text"]:
-            if text.get("#text", "") in self.INTEREST_CATS.values():
-                category_coord = text.get("@left")
+        category_coord = 106
+        interest_coord = 319
+        for text in first_page.texts:
+            if text.text in self.INTEREST_CATS.values():
+                category_coord = text.left
                 break
 
-        for text in first_page["text"]:
-            content = text.get("#text", "")
-            y_coord = text.get("@left")
-            if content and int(y_coord) > int(category_coord) and content != self.PAGE_SEPARATOR and len(content) > 1:
-                interest_coord = y_coord
+        for text in first_page.texts:
+            content = text.text
+            if content and text.left > category_coord and content != self.PAGE_SEPARATOR and len(content) > 1:
+                interest_coord = text.left
 
         return category_coord, interest_coord
 
-    def parse_pdf_data(self):
-        """Parse meta data, reps and their interest table"""
-
-        rep_start = self.first_page_with_rep_data()
-        pages = self.pdf_dict["pdf2xml"]["page"]
-        rep_pages = pages[rep_start:]
-
-        non_rep_headers = [
-            "Representanter",
-            "Regjeringsmedlemmer",
-            "Vararepresentanter",
-        ]
+    def parse_pdf_data(self, pages=None, columns=None):
+        """
+        Parse meta data, reps and their interest table
+
+        pages can be any iterable of Page or xmltodict pages (e.g. streamed from iter_pdf_pages), defaults to
+        pdf_dict pages. Rep pages are classified and parsed one at a time as they arrive (see classified_runs), so
+        streamed pages are parsed while pdftohtml extracts the next ones. With (category, interest) columns from a page
+        index, pages can be any page range of the rep pages.
+
+        Sets page_index to the page range of each parsed rep.
+        """
+        if pages is None:
+            pages = self.page_dicts
+        pages = iter(pages)
+        if columns is None:
+            first_rep_page = self.next_page_with_rep_data(pages)
+            rep_pages = chain([first_rep_page], pages)
+            columns = self.find_y_coords(first_rep_page)
+            starts_mid_rep = False
+        else:
+            rep_pages = pages
+            starts_mid_rep = True
+
+        classifier = LineClassifier(
+            self.INTEREST_CATS,
+            *columns,
+            non_rep_headers=self.NON_REP_HEADERS,
+            page_separator=self.PAGE_SEPARATOR,
+        )
         split_headers = ["Abrahamsen,", "Amundsen,"]
-        category_col_y_coord, interest_col_y_coord = self.find_y_coords(rep_pages[0])
 
         reps = []
         last_rep = None
         by_category = {}
         last_category = None
-        last_text = ""
-        swallowed_next = False
+        category_text = None
+        last_lines = []
+        split_header = None
         num_reps = 0
-
-        for page in rep_pages:
-            texts = page["text"]
-            for text_idx, text in enumerate(texts):
-                # all reps are in bold (headers) with a few exceptions
-                header = text.get("b", "")
-                content = text.get("#text", "")
-
-                is_rep_header = bool(header and header not in non_rep_headers)
-                is_category = self.is_category_text(category_col_y_coord, content, page, text)
-                is_interest_text = content and text["@left"] == interest_col_y_coord
-
-                if is_rep_header:
-                    # Should we swallow next?
+        rep_page_ranges = []
+        first_page_number = last_page_number = None
+
+        for role, bold, content, page_number in self.classified_runs(classifier, rep_pages):
+            # all reps are in bold (headers) with a few exceptions
+            if role == REP_HEADER:
+                header = bold
+                if split_header is not None:
+                    # Representative name header continued from the run before
+                    header = f"{split_header} {header}"
+                    split_header = None
+                elif header in split_headers or header[-1] == "-":
                     # Representative name header on same line or continues on next line
-                    should_swallow_next = header in split_headers or header[-1] == "-"
-                    if should_swallow_next:
-                        header = f'{header} {texts[text_idx + 1].get("b")}'
-                        swallowed_next = True
-                    elif swallowed_next:
-                        swallowed_next = False
-                        continue  # skip
-
-                    if last_category and last_text:
-                        # flush interest text
-                        by_category[last_category] = last_text
-                        last_text = ""
-
-                    if by_category:
-                        # flush category data to previous rep
-                        rep_data = {**last_rep, "by_category": by_category}
-                        reps.append(rep_data)
-                        by_category = {}
-
-                    rep_pattern = re.compile(
-                        r"(?P<full_name>[-\w,. ]+)\(((?P<rep_number>\d+), )?(?P<party>\w+),? ?([-,\w\s]+)?\)"
-                    )
-                    m = rep_pattern.match(header)
-                    if not m:
-                        raise ValueError(f"No representative matched in representative header: {header}")
-
-                    last_name, first_name = m.group("full_name").split(", ")
-                    last_rep = {
-                        "first_name": first_name.strip(),
-                        "last_name": last_name.strip(),
-                        "party": m.group("party").lower(),
-                    }
-                    num_reps += 1
-
-                elif is_category:
-                    if last_category and last_text:
-                        # flush interest text
-                        by_category[last_category] = last_text
-                        last_text = ""
-
-                    last_category = "1"
-
-                    # Handle hyphenated categories
-                    if content[-1] == "-":
-                        if text_idx < len(texts) - 1:
-                            next_content = texts[text_idx + 1]
-                            content = f"{content[:-1]}{next_content}"
-                        # FIXME: Page wrap
-                        elif content == "Har ingen registreringsplik-":
-                            content = "Har ingen registreringspliktige interesser"
-
-                    if "§" in content:
-                        last_category = content.replace("§", "").split(" ")[0].strip()
-                    elif content in self.CAT_INDEX:
-                        last_category = self.CAT_INDEX[content]
-
-                elif is_interest_text:
-                    last_text = f"{last_text}\n{content}" if last_text else f"{last_text}{content}"
+                    split_header = header
+                    continue
+
+                if last_rep is None and starts_mid_rep:
+                    # a page range can start with the end of a rep outside of it
+                    last_lines = []
+                    by_category = {}
+
+                if last_category and last_lines:
+                    # flush interest text
+                    by_category[last_category] = "\n".join(last_lines)
+                    last_lines = []
+
+                if by_category:
+                    # flush category data to previous rep
+                    rep_data = {**last_rep, "by_category": by_category}
+                    reps.append(rep_data)
+                    rep_page_ranges.append((first_page_number, last_page_number))
+                    by_category = {}
+
+                m = REP_PATTERN.match(header)
+                if not m:
+                    raise ValueError(f"No representative matched in representative header: {header}")
+
+                last_name, first_name = m.group("full_name").split(", ")
+                last_rep = {
+                    "first_name": first_name.strip(),
+                    "last_name": last_name.strip(),
+                    "party": m.group("party").lower(),
+                }
+                num_reps += 1
+                first_page_number = last_page_number = page_number
+
+            elif role == CATEGORY:
+                last_page_number = page_number
+                if last_category and last_lines:
+                    # flush interest text
+                    by_category[last_category] = "\n".join(last_lines)
+                    last_lines = []
+
+                category_text = content
+                last_category = classifier.category_key(category_text)
+
+            elif role == CATEGORY_CONTINUATION:
+                # interest text read since the first part is still unflushed and goes to the completed category
+                last_page_number = page_number
+                last_category = classifier.category_key(category_text, content)
+
+            elif role == INTEREST:
+                last_page_number = page_number
+                last_lines.append(content)
 
         # flush last data
-        if last_category and last_text:
-            by_category[last_category] = last_text
+        if last_category and last_lines:
+            by_category[last_category] = "\n".join(last_lines)
         reps.append(
             {
                 **last_rep,
                 "by_category": by_category,
             }
         )
+        rep_page_ranges.append((first_page_number, last_page_number))
+        self.page_index = {
+            "columns": list(columns),
+            "reps": [
+                {**{field: rep[field] for field in REP_FIELDS}, "first_page": first, "last_page": last}
+                for rep, (first, last) in zip(reps, rep_page_ranges)
+            ],
+        }
 
         if num_reps != len(reps):
             ValueError(f"Number of representatives {num_reps} does not match output {len(reps)}")
 
-        return reps
-
-    def is_category_text(self, category_col_y_coord, content, page, text):
-        if not content:
-            return False
-
-        if text["@left"] == category_col_y_coord and content != page["@number"]:
-            return True
+        metrics = self.metrics
+        if metrics.enabled:
+            metrics.count("rep_headers", num_reps)
+            metrics.count("reps", len(reps))
+            metrics.count("categories", sum(len(rep["by_category"]) for rep in reps))
 
-        if content.startswith("§"):
-            split_content = content.replace("§", "").split(" ")
-            if len(split_content) > 2 and content.replace("§", "").split(" ")[2] in self.CAT_INDEX:
-                return True
+        return reps
 
-        return False
+    def classified_runs(self, classifier, pages):
+        """
+        (role, bold, text, page number) of the runs on pages that are not skipped
+
+        Each page is read into its own DocumentLayout and classified when the previous one is parsed, runs of parsed
+        pages are not kept.
+        """
+        metrics = self.metrics
+        for page in pages:
+            with metrics.stage("layout"):
+                layout = DocumentLayout([page])
+                roles = classifier.classify_page(layout, 0)
+            metrics.count("rep_pages")
+            metrics.count("text_runs", len(layout))
+            page_number = layout.page_numbers[0]
+            bolds = layout.bold
+            texts = layout.text
+            for idx in compress(range(len(roles)), roles):
+                yield roles[idx], bolds[idx], texts[idx], page_number
 
     def last_updated_date(self, text):
         pattern = re.compile(r"Ajourført pr\. (.*)")
@@ -226,13 +349,28 @@ class InterestParser:
 
         return datetime.strptime(date_text, "%d %m %Y").date()
 
-    def parse_and_save(self, pdf_path, archive_pdf=True, seen=None):
-        self.pdf_dict = pdf_to_xml_dict(pdf_path)
-        meta = self.parse_document_meta()
+    def parse_and_save(self, pdf_path, archive_pdf=True, seen=None, manifest=None):
+        metrics = self.metrics
+        metrics.begin_document(pdf_path)
+        try:
+            return self._parse_and_save(pdf_path, archive_pdf, seen, manifest)
+        finally:
+            metrics.end_document()
+
+    def _parse_and_save(self, pdf_path, archive_pdf=True, seen=None, manifest=None):
+        metrics = self.metrics
+        with metrics.stage("extract"):
+            pages = self.extract_pages(pdf_path)
+            first_page = next(pages)
+        with metrics.stage("meta"):
+            meta = self.parse_document_meta(first_page)
         updated_at_str = meta["updated_at"].strftime("%Y-%m-%d")
 
         if seen and updated_at_str in seen:
             print("Skipping already parsed '{}'".format(pdf_path))
+            metrics.count("skipped")
+            if manifest is not None:
+                manifest.record(pdf_path, updated_at_str, self.output_paths(updated_at_str))
             return
 
         if archive_pdf:
@@ -242,35 +380,286 @@ class InterestParser:
             except shutil.SameFileError:
                 pass  # skip already archived
 
-        res = self.parse_pdf_data()
-        flattened = self.flatten_data(res)
+        with metrics.stage("parse", profile=True):
+            res = self.parse_pdf_data(chain([first_page], pages))
+        self.save(updated_at_str, res, page_index=self.page_index)
+        metrics.count("documents")
+        # only after the outputs are saved, a failed parse has to be retried by the next run
+        if manifest is not None:
+            manifest.record(pdf_path, updated_at_str, self.output_paths(updated_at_str))
 
-        field_names = ["first_name", "last_name", "party"] + list(self.INTEREST_CATS.values()) + [self.NO_REP_TEXTS[0]]
-        csv_path = DATA_DIR.joinpath(f"interests-{updated_at_str}.csv")
-        json_path = DATA_DIR.joinpath(f"interests-{updated_at_str}.json")
-        write_csv(csv_path, flattened, field_names)
-        write_json(
-            json_path,
-            {
-                "_meta": {
-                    "categories": self.INTEREST_CATS,
-                    "updated_at": updated_at_str,
-                },
-                "reps": res,
+        return updated_at_str
+
+    def save(self, updated_at_str, res, flattened=None, page_index=None):
+        """Write parsed representatives to CSV and JSON in DATA_DIR, and the page index if given"""
+        metrics = self.metrics
+        # the change files, database, search index and timelines read the other snapshots in DATA_DIR
+        with metrics.stage("restore"):
+            self.restore_outputs()
+        if flattened is None:
+            with metrics.stage("flatten"):
+                flattened = self.flatten_data(res)
+
+        csv_path, json_path = self.output_paths(updated_at_str)
+        snapshot_data = self.snapshot_data(updated_at_str, res)
+        with metrics.stage("write"):
+            written = {
+                csv_path: write_csv(csv_path, flattened, self.field_names()),
+                json_path: write_json(json_path, snapshot_data),
+            }
+            if self.json_gz:
+                json_gz_path = json_path.with_suffix(".json.gz")
+                written[json_gz_path] = write_json_gz(json_gz_path, snapshot_data)
+            if page_index is not None:
+                page_index_path = self.page_index_path(updated_at_str)
+                page_index_path.parent.mkdir(parents=True, exist_ok=True)
+                written[page_index_path] = write_json(page_index_path, page_index)
+        written_paths = [path for path, was_written in written.items() if was_written]
+        self.files_written += len(written_paths)
+        self.files_unchanged += len(written) - len(written_paths)
+        if metrics.enabled:
+            metrics.count("files_written", len(written_paths))
+            metrics.count("bytes_written", sum(path.stat().st_size for path in written_paths))
+        with metrics.stage("changes"):
+            write_changes(updated_at_str, res, categories=self.INTEREST_CATS, data_dir=DATA_DIR)
+        with metrics.stage("database"):
+            with InterestsDatabase(DATABASE_PATH) as db:
+                if db.is_empty():
+                    db.update(DATA_DIR, categories=self.INTEREST_CATS)
+                else:
+                    db.import_snapshot(json_path, categories=self.INTEREST_CATS)
+        with metrics.stage("archive"):
+            self.archive.add(json_path, csv_path)
+        with metrics.stage("search_index"):
+            self.search_index.add_reps(updated_at_str, res)
+            self.search_index.save()
+        with metrics.stage("timelines"):
+            self.timelines.add(updated_at_str, res, data_dir=DATA_DIR, categories=self.INTEREST_CATS)
+
+    @property
+    def archive(self):
+        if self._archive is None:
+            self._archive = SnapshotArchive(ARCHIVE_DIR)
+            if not ARCHIVE_DIR.exists():
+                self._archive.add_all(DATA_DIR)
+        return self._archive
+
+    def restore_outputs(self):
+        """Restore the JSON and CSV outputs of archived snapshots missing in DATA_DIR, returns their dates"""
+        if not ARCHIVE_DIR.exists():
+            # nothing archived yet, the first save archives the snapshots in DATA_DIR
+            return []
+        return self.archive.restore_missing(DATA_DIR)
+
+    @property
+    def search_index(self):
+        if self._search_index is None:
+            self._search_index = SearchIndex(SEARCH_INDEX_PATH)
+            if not SEARCH_INDEX_PATH.exists():
+                self._search_index.build(DATA_DIR, self.INTEREST_CATS)
+        return self._search_index
+
+    @property
+    def timelines(self):
+        if self._timelines is None:
+            self._timelines = Timelines(TIMELINES_DIR)
+        return self._timelines
+
+    @classmethod
+    def field_names(cls):
+        """CSV columns"""
+        return ["first_name", "last_name", "party"] + list(cls.INTEREST_CATS.values()) + [cls.NO_REP_TEXTS[0]]
+
+    @classmethod
+    def snapshot_data(cls, updated_at_str, res):
+        """JSON document of a snapshot"""
+        return {
+            "_meta": {
+                "categories": cls.INTEREST_CATS,
+                "updated_at": updated_at_str,
             },
+            "reps": res,
+        }
+
+    @staticmethod
+    def page_index_path(updated_at_str):
+        return DATA_DIR.joinpath(PAGE_INDEX_DIR_NAME, f"pages-{updated_at_str}.json")
+
+    def find_rep(self, pdf_path, last_name, first_name=None):
+        """
+        Parsed reps named last_name (and first_name) in PDF, parsing only their pages
+
+        Page ranges are read from the page index of the register, the index is built with a full parse if missing.
+        """
+
+        def matches(rep):
+            return rep["last_name"] == last_name and first_name in (None, rep["first_name"])
+
+        updated_at_str = self.probe_document_meta(pdf_path)["updated_at"].strftime("%Y-%m-%d")
+        page_index_path = self.page_index_path(updated_at_str)
+        page_index = read_json(page_index_path)
+        if page_index is None:
+            reps = self.parse_pdf_data(self.extract_pages(pdf_path))
+            page_index_path.parent.mkdir(parents=True, exist_ok=True)
+            write_json(page_index_path, self.page_index)
+            return [rep for rep in reps if matches(rep)]
+
+        reps = []
+        page_ranges = sorted(
+            {(entry["first_page"], entry["last_page"]) for entry in page_index["reps"] if matches(entry)}
+        )
+        for first_page, last_page in page_ranges:
+            pdf_dict = pdf_to_xml_dict(pdf_path, first_page=first_page, last_page=last_page)
+            reps += [
+                rep
+                for rep in self.parse_pdf_data(pdf_dict["pdf2xml"]["page"], columns=page_index["columns"])
+                if matches(rep) and rep not in reps
+            ]
+        return reps
+
+    @staticmethod
+    def output_paths(updated_at_str):
+        return (
+            DATA_DIR.joinpath(f"interests-{updated_at_str}.csv"),
+            DATA_DIR.joinpath(f"interests-{updated_at_str}.json"),
         )
 
-        return updated_at_str
+    def parse_all(self, jobs=1, force=False):
+        """
+        Parse PDFs in PDF_DIR
 
-    def parse_all(self):
+        PDFs the manifest knows are unchanged are skipped unless force is set. Remaining PDFs are deduplicated by
+        updated_at probed from their first page before any full extraction.
+        """
+        # the manifest only knows PDFs as unchanged if their outputs exist
+        self.restore_outputs()
+        manifest = ParseManifest.load(MANIFEST_PATH, self.PARSER_VERSION, checksum_index=self.checksum_index)
         seen = []
-        for pdf in PDF_DIR.glob("*.pdf"):
-            if self.verbose:
-                print(f"Parsing '{pdf}'")
-            last_updated_str = self.parse_and_save(pdf, archive_pdf=False, seen=seen)
-
-            if last_updated_str is not None:
-                seen.append(last_updated_str)
+        pdfs = []
+        errors = []
+        try:
+            for pdf in sorted(PDF_DIR.glob("*.pdf")):
+                entry = None if force else manifest.lookup(pdf)
+                if entry:
+                    if self.verbose:
+                        print(f"Skipping unchanged '{pdf}'")
+                    seen.append(entry["updated_at"])
+                    continue
+
+                try:
+                    with self.metrics.stage("probe"):
+                        updated_at_str = self.probe_document_meta(pdf)["updated_at"].strftime("%Y-%m-%d")
+                except Exception as e:
+                    if jobs <= 1:
+                        raise
+                    print(f"Failed parsing '{pdf}': {e!r}")
+                    errors.append((pdf, e))
+                    continue
+
+                if updated_at_str in seen:
+                    print("Skipping already parsed '{}'".format(pdf))
+                    manifest.record(pdf, updated_at_str, self.output_paths(updated_at_str))
+                    continue
+
+                seen.append(updated_at_str)
+                pdfs.append(pdf)
+
+            if jobs > 1:
+                return errors + self.parse_all_parallel(pdfs, jobs, manifest=manifest)
+
+            for pdf in pdfs:
+                if self.verbose:
+                    print(f"Parsing '{pdf}'")
+                self.parse_and_save(pdf, archive_pdf=False, manifest=manifest)
+        finally:
+            manifest.save()
+            if self.checksum_index is not None:
+                self.checksum_index.save()
+
+        return errors
+
+    def parse_all_parallel(self, pdfs, jobs, seen=None, manifest=None):
+        """
+        Extract and parse PDFs in a process pool.
+
+        Results are collected in input order so dedup by updated_at and the written output is the same as for a
+        serial run. Failing files are reported and returned instead of aborting the batch.
+        """
+        seen = seen if seen is not None else []
+        errors = []
+        metrics = self.metrics
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(parse_pdf_file, pdf, self.stream, self.layout_cache, metrics.enabled) for pdf in pdfs
+            ]
+            for pdf, future in zip(pdfs, futures):
+                if self.verbose:
+                    print(f"Parsing '{pdf}'")
+                try:
+                    updated_at_str, res, flattened, page_index, worker_metrics = future.result()
+                except Exception as e:
+                    print(f"Failed parsing '{pdf}': {e!r}")
+                    errors.append((pdf, e))
+                    continue
+
+                metrics.begin_document(pdf)
+                if worker_metrics is not None:
+                    metrics.merge(worker_metrics)
+                if updated_at_str not in seen:
+                    self.save(updated_at_str, res, flattened, page_index)
+                    seen.append(updated_at_str)
+                    metrics.count("documents")
+                else:
+                    print("Skipping already parsed '{}'".format(pdf))
+                    metrics.count("skipped")
+                metrics.end_document()
+
+                if manifest is not None:
+                    manifest.record(pdf, updated_at_str, self.output_paths(updated_at_str))
+
+        return errors
+
+    def verify_all(self, jobs=1):
+        """
+        Parse PDFs in PDF_DIR in memory and diff them against their outputs in DATA_DIR, without writing outputs
+
+        Returns (pdf, updated_at, changes) per parsed register, changes is None if the output is unchanged, a
+        diff_reps dict otherwise. PDFs that fail are returned as (pdf, None, exception).
+        """
+        self.restore_outputs()
+        pdfs = sorted(PDF_DIR.glob("*.pdf"))
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(parse_pdf_file, pdf, self.stream, self.layout_cache) for pdf in pdfs]
+                parsed = [(pdf, future.exception() or future.result()) for pdf, future in zip(pdfs, futures)]
+        else:
+            parsed = []
+            for pdf in pdfs:
+                try:
+                    parsed.append((pdf, parse_pdf_file(pdf, self.stream, self.layout_cache)))
+                except Exception as e:
+                    parsed.append((pdf, e))
+
+        seen = set()
+        results = []
+        for pdf, result in parsed:
+            if isinstance(result, Exception):
+                results.append((pdf, None, result))
+                continue
+
+            updated_at_str, res = result[:2]
+            if updated_at_str in seen:
+                continue
+            seen.add(updated_at_str)
+
+            _, json_path = self.output_paths(updated_at_str)
+            existing = load_snapshot(json_path, self.INTEREST_CATS) if json_path.exists() else []
+            changes = diff_reps(existing, res)
+            if any(changes.values()):
+                results.append((pdf, updated_at_str, changes))
+            else:
+                results.append((pdf, updated_at_str, None))
+        return results
 
     def flatten_data(self, data):
         flattened = []
@@ -288,6 +677,46 @@ class InterestParser:
         return flattened
 
 
+def parse_pdf_file(pdf_path, stream=False, layout_cache=None, collect_metrics=False):
+    """
+    Extract and parse a single PDF, used as process pool worker by InterestParser.parse_all
+
+    Returns (updated_at, reps, flattened reps, page index, metrics dict or None).
+    """
+    metrics = Metrics() if collect_metrics else NULL_METRICS
+    parser = InterestParser(stream=stream, layout_cache=layout_cache, metrics=metrics)
+    with metrics.stage("extract"):
+        pages = parser.extract_pages(pdf_path)
+        first_page = next(pages)
+    with metrics.stage("meta"):
+        updated_at_str = parser.parse_document_meta(first_page)["updated_at"].strftime("%Y-%m-%d")
+    with metrics.stage("parse"):
+        res = parser.parse_pdf_data(chain([first_page], pages))
+    with metrics.stage("flatten"):
+        flattened = parser.flatten_data(res)
+    return updated_at_str, res, flattened, parser.page_index, metrics.as_dict() if collect_metrics else None
+
+
+def print_verification(results, verbose=False):
+    """Print summary of InterestParser.verify_all results, returns exit code 1 if any output differs or failed"""
+    failed = changed = 0
+    for pdf, updated_at_str, changes in results:
+        if updated_at_str is None:
+            failed += 1
+            print(f"{pdf}: FAILED {changes!r}")
+        elif changes is None:
+            if verbose:
+                print(f"{pdf} ({updated_at_str}): OK")
+        else:
+            changed += 1
+            counts = ", ".join(f"{len(changes[kind])} {kind}" for kind in ("added", "removed", "changed"))
+            print(f"{pdf} ({updated_at_str}): {counts}")
+            for line in summarize_changes(changes, InterestParser.INTEREST_CATS):
+                print(f"  {line}")
+    print(f"VERIFIED: {len(results)}, CHANGED: {changed}, FAILED: {failed}")
+    return 1 if changed or failed else 0
+
+
 def parse_cli_args():
     desc = InterestParser.__doc__
     p = argparse.ArgumentParser(description=desc)
@@ -295,25 +724,157 @@ def parse_cli_args():
         "--file",
         help="Parse given PDF by filename",
     )
+    p.add_argument(
+        "--stdin",
+        action="store_true",
+        default=False,
+        help="Parse PDF read from stdin and print the JSON snapshot, or save it with --save",
+    )
+    p.add_argument(
+        "--save",
+        action="store_true",
+        default=False,
+        help="Save outputs of --stdin to DATA_DIR",
+    )
     p.add_argument(
         "--all",
         action="store_true",
         default=False,
         help="Parse PDFs in PDF_DIR",
     )
+    p.add_argument(
+        "--probe",
+        action="store_true",
+        default=False,
+        help="Only print updated_at of given PDF(s), read from the first page",
+    )
+    p.add_argument(
+        "--rep",
+        help='Only print interests of representative "Last name" or "Last name, First name" in --file',
+    )
+    p.add_argument(
+        "--verify",
+        action="store_true",
+        default=False,
+        help="Parse PDFs in PDF_DIR and print differences from the outputs in DATA_DIR, without writing them",
+    )
+    p.add_argument(
+        "--force",
+        action="store_true",
+        default=False,
+        help="Parse all PDFs with --all, even if the manifest says they are unchanged",
+    )
+    p.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used with --all",
+    )
+    p.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Extract each PDF with this many concurrent pdftohtml processes (not with --jobs, --stream or --verify)",
+    )
+    p.add_argument(
+        "--stream",
+        action="store_true",
+        default=False,
+        help="Stream pdftohtml output page by page instead of parsing the whole document at once",
+    )
+    p.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="Bypass the extracted layout cache",
+    )
+    p.add_argument(
+        "--clear-cache",
+        action="store_true",
+        default=False,
+        help="Clear the extracted layout cache",
+    )
+    p.add_argument(
+        "--json-gz",
+        action="store_true",
+        default=False,
+        help="Also write compact gzipped JSON (interests-<date>.json.gz) for machine consumers",
+    )
+    p.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="Write stage timings and counters (pages, text runs, reps, bytes written) as JSON to PATH",
+    )
+    p.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="Write cProfile stats of the parse loop to PATH, only covers parsing in this process (not --jobs workers)",
+    )
     p.add_argument("--verbose", action="store_true", default=False, help="Verbose output")
 
     _args = p.parse_args()
 
-    if (not _args.all and not _args.file) or (_args.all and _args.file):
-        p.error("Provide either --all or --file")
+    if _args.shards > 1 and (_args.jobs > 1 or _args.stream or _args.verify):
+        # shards split the pdftohtml run of one document in this process, which those modes do not use
+        p.error("--shards can not be combined with --jobs, --stream or --verify")
+    if _args.clear_cache and not (_args.all or _args.file or _args.stdin):
+        return _args
+    if _args.verify:
+        return _args
+    if _args.rep and not _args.file:
+        p.error("--rep needs --file")
+    if sum(map(bool, (_args.all, _args.file, _args.stdin))) != 1:
+        p.error("Provide either --all, --file or --stdin")
     return _args
 
 
 if __name__ == "__main__":
     args = parse_cli_args()
-    parser = InterestParser(verbose=args.verbose)
-    if args.all:
-        parser.parse_all()
-    else:
-        parser.parse_and_save(Path(args.file))
+    if args.clear_cache:
+        LayoutCache().clear()
+    checksum_index = ChecksumIndex()
+    layout_cache = None if args.no_cache else LayoutCache(checksum_index=checksum_index)
+    metrics = Metrics(profile=bool(args.profile)) if args.metrics or args.profile else None
+    parser = InterestParser(
+        verbose=args.verbose,
+        stream=args.stream,
+        layout_cache=layout_cache,
+        checksum_index=checksum_index,
+        metrics=metrics,
+        json_gz=args.json_gz,
+        shards=args.shards,
+    )
+    try:
+        if args.probe and args.stdin:
+            print(f"-: {parser.probe_document_meta(sys.stdin.buffer.read())['updated_at'].isoformat()}")
+        elif args.probe:
+            for pdf in sorted(PDF_DIR.glob("*.pdf")) if args.all else [Path(args.file)]:
+                print(f"{pdf}: {parser.probe_document_meta(pdf)['updated_at'].isoformat()}")
+        elif args.rep:
+            last_name, _, first_name = args.rep.partition(",")
+            reps = parser.find_rep(Path(args.file), last_name.strip(), first_name.strip() or None)
+            print(dumps_json(reps))
+        elif args.verify:
+            sys.exit(print_verification(parser.verify_all(jobs=args.jobs), verbose=args.verbose))
+        elif args.all:
+            errors = parser.parse_all(jobs=args.jobs, force=args.force)
+            if errors:
+                print(f"Failed parsing {len(errors)} PDF(s)")
+                sys.exit(1)
+        elif args.file:
+            parser.parse_and_save(Path(args.file))
+            checksum_index.save()
+        elif args.stdin:
+            meta, reps = parser.parse_bytes(sys.stdin.buffer.read())
+            updated_at_str = meta["updated_at"].strftime("%Y-%m-%d")
+            if args.save:
+                parser.save(updated_at_str, reps)
+            else:
+                print(dumps_json(parser.snapshot_data(updated_at_str, reps)))
+    finally:
+        if parser.files_written or parser.files_unchanged:
+            print(f"Wrote {parser.files_written} output files, {parser.files_unchanged} unchanged")
+        if args.metrics:
+            write_json(Path(args.metrics), metrics.as_dict())
+        if args.profile:
+            metrics.dump_profile(Path(args.profile))
@@ -1,23 +1,26 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date
+from urllib.parse import urljoin
 
 from bs4 import BeautifulSoup
 
-import requests
 from tqdm import tqdm
 
-from settings import PDF_DIR
-from utils import MONTHS_NB, download
+from checksum_index import ChecksumIndex
+from manifest import ParseManifest
+from parser import InterestParser
+from settings import CHECKSUM_INDEX_PATH, MANIFEST_PATH, PDF_DIR, HTTP_STATE_FILE_NAME
+from utils import MONTHS_NB, DOWNLOAD_TIMEOUT, fetch, make_session, read_json, write_json
 
 PDF_LIST_URL = "https://www.stortinget.no/no/Stortinget-og-demokratiet/Representantene/Okonomiske-interesser/register-for-stortingsrepresentantenes-verv-og-okonomiske-interesser-for-stortingsperioden-20172021/"
 
 
-def scrape(verbose=False, dry_run=False):
-    """ Scrape it til' you make it"""
-    # Fetch PDF URLs
-    res = requests.get(PDF_LIST_URL)
+def list_pdfs(session, list_url=PDF_LIST_URL, pdf_dir=PDF_DIR):
+    """PDFs linked from the listing page, as dicts of url and file_name in pdf_dir named by the register date"""
+    res = session.get(list_url, timeout=DOWNLOAD_TIMEOUT)
     soup = BeautifulSoup(res.text, "html.parser")
-    pdfs_to_download = []
+    pdfs = []
     for link in soup.find_all("a"):
         url = link.get("href")
         if url[-3:] != "pdf":
@@ -29,10 +32,26 @@ def scrape(verbose=False, dry_run=False):
         month = int(MONTHS_NB.get(stripped_date.split(" ")[1].strip()))
         year = int(stripped_date[-4:])
         iso_date = date(year=year, month=month, day=day).isoformat()
-        if not url.startswith("https://"):
-            url = f"https://www.stortinget.no{url}"
-        file_name = PDF_DIR.joinpath(f"interests-{iso_date}.pdf")
-        pdfs_to_download.append({"url": url, "file_name": file_name})
+        url = urljoin(list_url, url)
+        file_name = pdf_dir.joinpath(f"interests-{iso_date}.pdf")
+        pdfs.append({"url": url, "file_name": file_name})
+    return pdfs
+
+
+def fetch_and_probe(pdf, interest_parser, **kwargs):
+    """Download pdf, returns updated_at probed from its bytes if it is new or changed, else None"""
+    content = fetch(pdf["url"], pdf["file_name"], **kwargs)
+    if content is None:
+        return None
+    return interest_parser.probe_document_meta(content)["updated_at"].isoformat()
+
+
+def scrape(verbose=False, dry_run=False, jobs=4, list_url=PDF_LIST_URL, pdf_dir=PDF_DIR):
+    """Scrape it til' you make it"""
+    session = make_session(pool_size=jobs)
+
+    # Fetch PDF URLs
+    pdfs_to_download = list_pdfs(session, list_url, pdf_dir)
 
     print(f"Found {len(pdfs_to_download)} pdfs to download...")
     if verbose:
@@ -42,24 +61,66 @@ def scrape(verbose=False, dry_run=False):
     if dry_run:
         return
 
-    # Download
+    # Download, concurrently over a shared connection pool and conditional on stored ETag/Last-Modified
+    http_state_path = pdf_dir.joinpath(HTTP_STATE_FILE_NAME)
+    http_state = read_json(http_state_path, default={})
+    checksum_index = ChecksumIndex(CHECKSUM_INDEX_PATH)
+    # New PDFs are probed from the downloaded bytes as each download completes, only updated_at is kept
+    interest_parser = InterestParser()
     skipped = []
-    new = []
-    for pdf in tqdm(pdfs_to_download, desc="pdfs"):
-        if not download(pdf["url"], pdf["file_name"]):
-            skipped.append(pdf["file_name"])
-        else:
-            new.append(pdf["file_name"])
+    new = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(
+                fetch_and_probe,
+                pdf,
+                interest_parser,
+                session=session,
+                http_state=http_state,
+                checksum_index=checksum_index,
+            ): pdf
+            for pdf in pdfs_to_download
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="pdfs"):
+            pdf = futures[future]
+            try:
+                updated_at_str = future.result()
+            except Exception as e:
+                print(f"Failed downloading '{pdf['url']}': {e!r}")
+                failed.append(pdf["file_name"])
+                continue
+
+            if updated_at_str is None:
+                skipped.append(pdf["file_name"])
+            else:
+                new[pdf["file_name"]] = updated_at_str
+
+    write_json(http_state_path, dict(sorted(http_state.items())))
+    checksum_index.save()
+
+    # Only content the current parser has not produced outputs from needs a full parse, this includes corrected
+    # registers for a date that already has outputs
+    manifest = ParseManifest.load(MANIFEST_PATH, InterestParser.PARSER_VERSION, checksum_index=checksum_index)
+    to_parse = [file_name for file_name in sorted(new) if not manifest.lookup(file_name)]
 
     print("DONE")
     print(f"NEW: {len(new)}")
     print(f"EXISTING: {len(skipped)}")
+    print(f"FAILED: {len(failed)}")
+    print(f"TO PARSE: {len(to_parse)}")
+    if verbose:
+        for file_name in to_parse:
+            print(f"{file_name} ({new[file_name]})")
+
+    return to_parse
 
 
 def parse_cli_args():
     p = argparse.ArgumentParser(description="Scrape representative interest PDFs")
     p.add_argument("--verbose", action="store_true", default=False, help="Verbose output")
     p.add_argument("--dry-run", action="store_true", default=False, help="Don't download PDFs")
+    p.add_argument("--jobs", type=int, default=4, help="Number of concurrent downloads")
 
     return vars(p.parse_args())
 
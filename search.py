@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+import argparse
+import gzip
+import json
+import re
+from bisect import bisect_left
+from pathlib import Path
+from time import perf_counter
+
+from archive import SnapshotArchive
+from settings import DATA_DIR, SEARCH_INDEX_PATH
+from snapshots import load_snapshot, rep_key, snapshot_date, snapshot_paths
+from utils import write_json_gz
+
+TOKEN_PATTERN = re.compile(r"\w+")
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class Term:
+    """Query term, a word or a phrase of words, the last word is a prefix if the term ends with *"""
+
+    def __init__(self, tokens, prefix=False):
+        self.tokens = tokens
+        self.prefix = prefix
+
+    def matches(self, tokens):
+        """Whether the term occurs in tokens"""
+        *head, last = self.tokens
+        n = len(head)
+        for i in range(len(tokens) - n):
+            if tokens[i : i + n] == head and (tokens[i + n].startswith(last) if self.prefix else tokens[i + n] == last):
+                return True
+        return False
+
+
+def parse_query(query):
+    """Terms of query: words, prefixes (equi*) and "quoted phrases", all terms have to match"""
+    terms = []
+    for phrase, word in QUERY_PATTERN.findall(query):
+        term = phrase or word
+        tokens = tokenize(term)
+        if tokens:
+            terms.append(Term(tokens, prefix=term.endswith("*")))
+    return terms
+
+
+class SearchIndex:
+    """
+    Inverted index of the interest texts of all snapshots, token -> ids of the distinct texts it occurs in.
+
+    Texts repeat from snapshot to snapshot, so each distinct text is stored and tokenized once and snapshots keep
+    (rep, category, text id) records. Adding a snapshot only tokenizes texts not seen before, adding it again replaces
+    its records. Stored as gzipped compact JSON in one file, outside of the repository since it can be rebuilt from the
+    snapshots.
+    """
+
+    def __init__(self, path: Path = SEARCH_INDEX_PATH):
+        self.path = path
+        self.clear()
+        if path.exists():
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            self.reps = data["reps"]
+            self.texts = data["texts"]
+            self.postings = data["postings"]
+            self.snapshots = data["snapshots"]
+            self.rep_ids = {tuple(rep): rep_id for rep_id, rep in enumerate(self.reps)}
+            self.text_ids = {text: text_id for text_id, text in enumerate(self.texts)}
+
+    def clear(self):
+        self.reps = []  # [last_name, first_name, party]
+        self.texts = []
+        self.postings = {}
+        self.snapshots = {}  # updated_at -> [[rep id, category, text id], ...]
+        self.rep_ids = {}
+        self.text_ids = {}
+        self._tokens = None
+
+    def rep_id(self, rep):
+        key = rep_key(rep)
+        rep_id = self.rep_ids.get(key)
+        if rep_id is None:
+            rep_id = self.rep_ids[key] = len(self.reps)
+            self.reps.append(list(key))
+        return rep_id
+
+    def text_id(self, text):
+        text_id = self.text_ids.get(text)
+        if text_id is None:
+            text_id = self.text_ids[text] = len(self.texts)
+            self.texts.append(text)
+            # ids only grow, so postings stay sorted
+            for token in sorted(set(tokenize(text))):
+                self.postings.setdefault(token, []).append(text_id)
+            self._tokens = None
+        return text_id
+
+    def add_reps(self, updated_at_str, reps):
+        records = []
+        for rep in reps:
+            rep_id = self.rep_id(rep)
+            for category, text in rep["by_category"].items():
+                # legacy snapshots have some non-text values
+                if isinstance(text, str) and text:
+                    records.append([rep_id, category, self.text_id(text)])
+        self.snapshots[updated_at_str] = records
+
+    def add(self, json_path: Path, categories=None):
+        self.add_reps(snapshot_date(json_path), load_snapshot(json_path, categories))
+
+    def build(self, data_dir: Path = DATA_DIR, categories=None):
+        """Index all snapshots in data_dir from scratch, dropping texts no snapshot refers to anymore"""
+        self.clear()
+        for json_path in snapshot_paths(data_dir):
+            self.add(json_path, categories)
+        return len(self.snapshots)
+
+    def save(self):
+        data = {
+            "reps": self.reps,
+            "texts": self.texts,
+            "postings": self.postings,
+            "snapshots": dict(sorted(self.snapshots.items())),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        return write_json_gz(self.path, data)
+
+    def tokens(self):
+        """All indexed tokens, sorted for prefix lookups"""
+        if self._tokens is None:
+            self._tokens = sorted(self.postings)
+        return self._tokens
+
+    def token_text_ids(self, token, prefix=False):
+        if not prefix:
+            return set(self.postings.get(token, ()))
+        tokens = self.tokens()
+        text_ids = set()
+        for idx in range(bisect_left(tokens, token), len(tokens)):
+            if not tokens[idx].startswith(token):
+                break
+            text_ids.update(self.postings[tokens[idx]])
+        return text_ids
+
+    def term_text_ids(self, term):
+        *head, last = term.tokens
+        text_ids = self.token_text_ids(last, term.prefix)
+        for token in head:
+            text_ids &= self.token_text_ids(token)
+        if head:
+            # candidates have all words of the phrase, check that they are in order
+            text_ids = {text_id for text_id in text_ids if term.matches(tokenize(self.texts[text_id]))}
+        return text_ids
+
+    def search(self, query, category=None):
+        """Interests matching all terms of query, as dicts of updated_at, rep fields, category and text, oldest first"""
+        terms = parse_query(query)
+        if not terms:
+            return []
+        text_ids = self.term_text_ids(terms[0])
+        for term in terms[1:]:
+            if not text_ids:
+                break
+            text_ids &= self.term_text_ids(term)
+
+        hits = []
+        for updated_at_str, records in sorted(self.snapshots.items()):
+            for rep_id, category_key, text_id in records:
+                if text_id in text_ids and category in (None, category_key):
+                    last_name, first_name, party = self.reps[rep_id]
+                    hits.append(
+                        {
+                            "updated_at": updated_at_str,
+                            "first_name": first_name,
+                            "last_name": last_name,
+                            "party": party,
+                            "category": category_key,
+                            "text": self.texts[text_id],
+                        }
+                    )
+        return hits
+
+
+def matching_lines(text, terms):
+    """Lines of text that match any of terms"""
+    return [line for line in text.split("\n") if any(term.matches(tokenize(line)) for term in terms)]
+
+
+def print_hits(hits, terms):
+    """Print hits grouped by rep, category and matching lines, with the first and last snapshot they appear in"""
+    groups = {}
+    for hit in hits:
+        lines = tuple(matching_lines(hit["text"], terms)) or tuple(hit["text"].split("\n"))
+        key = (hit["last_name"], hit["first_name"], hit["party"], hit["category"], lines)
+        groups.setdefault(key, []).append(hit["updated_at"])
+
+    for (last_name, first_name, party, category, lines), dates in sorted(groups.items()):
+        print(f"{last_name}, {first_name} ({party}) [{category}] {dates[0]}..{dates[-1]} ({len(dates)} snapshots)")
+        for line in lines:
+            print(f"    {line}")
+
+
+def parse_cli_args():
+    p = argparse.ArgumentParser(description="Full-text search over the interest texts of all snapshots")
+    p.add_argument("query", nargs="?", help='Words, prefixes (equi*) and "quoted phrases", all have to match')
+    p.add_argument(
+        "--build",
+        action="store_true",
+        default=False,
+        help="Rebuild the index from all snapshots, a missing index is always built",
+    )
+    p.add_argument("--category", help="Limit to category key")
+    p.add_argument("--json", action="store_true", default=False, help="Print hits as JSON lines")
+
+    args = p.parse_args()
+    if not args.query and not args.build:
+        p.error("Give a query or --build")
+    return args
+
+
+if __name__ == "__main__":
+    from parser import InterestParser
+
+    args = parse_cli_args()
+    index = SearchIndex()
+    if args.build or not index.path.exists():
+        SnapshotArchive().restore_missing()
+        num_snapshots = index.build(categories=InterestParser.INTEREST_CATS)
+        index.save()
+        print(f"Indexed {num_snapshots} snapshots, {len(index.texts)} texts, {len(index.postings)} tokens")
+    if args.query:
+        start = perf_counter()
+        hits = index.search(args.query, args.category)
+        elapsed = perf_counter() - start
+        if args.json:
+            for hit in hits:
+                print(json.dumps(hit, ensure_ascii=False))
+        else:
+            print_hits(hits, parse_query(args.query))
+            print(f"{len(hits)} hits in {elapsed * 1000:.1f} ms")
@@ -2,4 +2,27 @@ from pathlib import Path
 
 PDF_DIR = Path("pdfs")
 DATA_DIR = Path("data")
+CACHE_DIR = Path(".cache")
 
+# ETag/Last-Modified per PDF URL, kept with the archived PDFs
+HTTP_STATE_FILE_NAME = "http_state.json"
+# Per snapshot change sets and a running changelog, in DATA_DIR
+CHANGES_DIR_NAME = "changes"
+CHANGELOG_FILE_NAME = "changelog.jsonl"
+# Page range of each rep per register, in DATA_DIR
+PAGE_INDEX_DIR_NAME = "pages"
+MANIFEST_PATH = DATA_DIR.joinpath("manifest.json")
+# Interest timeline of each rep over all snapshots, for profile pages
+TIMELINES_DIR = DATA_DIR.joinpath("timelines")
+# Deduplicated text store and per snapshot records referencing it, the committed form of the snapshots. Their JSON and
+# CSV outputs in DATA_DIR are not committed and are restored from it when missing.
+ARCHIVE_DIR = DATA_DIR.joinpath("archive")
+CHECKSUM_INDEX_PATH = CACHE_DIR.joinpath("checksums.json")
+# SQLite archive of the snapshots in DATA_DIR, filled from them when missing
+DATABASE_PATH = CACHE_DIR.joinpath("interests.sqlite3")
+# Inverted index of the interest texts of all snapshots for search.py, built from DATA_DIR when missing
+SEARCH_INDEX_PATH = CACHE_DIR.joinpath("search_index.json.gz")
+LAYOUT_CACHE_DIR = CACHE_DIR.joinpath("layout")
+LAYOUT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Stage timings of benchmark.py --save-baseline
+BENCHMARK_BASELINE_PATH = Path("benchmark_baseline.json")
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import json
+from pathlib import Path
+
+from settings import DATA_DIR
+
+REP_FIELDS = ["first_name", "last_name", "party"]
+
+
+def snapshot_date(path: Path):
+    return path.stem.replace("interests-", "")
+
+
+def snapshot_paths(data_dir: Path = DATA_DIR):
+    """Parsed snapshots in data_dir, oldest first"""
+    return sorted(data_dir.glob("interests-*.json"), key=snapshot_date)
+
+
+def previous_snapshot_path(updated_at_str, data_dir: Path = DATA_DIR):
+    previous = [path for path in snapshot_paths(data_dir) if snapshot_date(path) < updated_at_str]
+    return previous[-1] if previous else None
+
+
+def next_snapshot_path(updated_at_str, data_dir: Path = DATA_DIR):
+    following = [path for path in snapshot_paths(data_dir) if snapshot_date(path) > updated_at_str]
+    return following[0] if following else None
+
+
+def normalize_reps(data, categories=None):
+    """
+    Reps of a snapshot in the current format, {first_name, last_name, party, by_category}.
+
+    Snapshots before 2020-03-23 are lists of flattened reps with category names as keys, these are mapped back to
+    category keys using categories (key -> name).
+    """
+    if isinstance(data, dict):
+        return data["reps"]
+
+    category_keys = {name: key for key, name in (categories or {}).items()}
+    reps = []
+    for row in data:
+        rep = {field: row.get(field, "") for field in REP_FIELDS}
+        rep["party"] = rep["party"].lower()
+        rep["by_category"] = {
+            category_keys.get(name, name): text
+            for name, text in row.items()
+            if name not in REP_FIELDS and name != "rep_number" and text
+        }
+        reps.append(rep)
+    return reps
+
+
+def load_snapshot(path: Path, categories=None):
+    with path.open() as f:
+        return normalize_reps(json.load(f), categories)
+
+
+def rep_key(rep):
+    return rep["last_name"], rep["first_name"], rep["party"].lower()
+
+
+def index_reps(reps):
+    """Map (last_name, first_name, party) -> by_category, category texts of duplicate reps are merged"""
+    index = {}
+    for rep in reps:
+        by_category = index.setdefault(rep_key(rep), {})
+        for category, text in rep["by_category"].items():
+            by_category.setdefault(category, text)
+    return index
@@ -0,0 +1,58 @@
+from archive import SnapshotArchive
+from parser import InterestParser
+from utils import write_csv, write_json
+
+
+def test_archive_restores_outputs(tmp_path):
+    data_dir = tmp_path.joinpath("data")
+    data_dir.mkdir()
+    # snapshots before 2020-03-23 are lists of flattened reps
+    legacy = [{"rep_number": "1", "first_name": "Johan", "last_name": "Aas", "party": "FrP", "Aksjer mv.": "Equinor"}]
+    write_json(data_dir.joinpath("interests-2020-02-27.json"), legacy)
+    write_csv(data_dir.joinpath("interests-2020-02-27.csv"), legacy, list(legacy[0]))
+    reps = [
+        {
+            "first_name": "Johan",
+            "last_name": "Aas",
+            "party": "frp",
+            "by_category": {"9": "Equinor", "11": "Jakke\nBåt"},
+        },
+        {"first_name": "Kari", "last_name": "Henriksen", "party": "a", "by_category": {"9": "Equinor"}},
+    ]
+    write_json(
+        data_dir.joinpath("interests-2020-03-23.json"),
+        {"_meta": {"categories": InterestParser.INTEREST_CATS, "updated_at": "2020-03-23"}, "reps": reps},
+    )
+    field_names = ["first_name", "last_name", "party"] + list(InterestParser.INTEREST_CATS.values())
+    write_csv(data_dir.joinpath("interests-2020-03-23.csv"), InterestParser().flatten_data(reps), field_names)
+
+    archive = SnapshotArchive(tmp_path.joinpath("archive"))
+    assert archive.add_all(data_dir) == 2
+    assert archive.add_all(data_dir) == 0
+    assert sorted(archive.store.texts.values()) == ["Equinor", "Jakke\nBåt"]
+
+    archive = SnapshotArchive(tmp_path.joinpath("archive"))
+    assert archive.verify(data_dir) == []
+    restored_dir = tmp_path.joinpath("restored")
+    assert list(archive.restore(restored_dir)) == ["2020-02-27", "2020-03-23"]
+    for path in data_dir.iterdir():
+        assert restored_dir.joinpath(path.name).read_bytes() == path.read_bytes()
+
+    # replacing a snapshot removes the texts only its old version referred to
+    reps[0]["by_category"]["11"] = "Jakke"
+    write_json(
+        data_dir.joinpath("interests-2020-03-23.json"),
+        {"_meta": {"categories": InterestParser.INTEREST_CATS, "updated_at": "2020-03-23"}, "reps": reps},
+    )
+    write_csv(data_dir.joinpath("interests-2020-03-23.csv"), InterestParser().flatten_data(reps), field_names)
+    assert archive.add(data_dir.joinpath("interests-2020-03-23.json"))
+    archive = SnapshotArchive(tmp_path.joinpath("archive"))
+    assert sorted(archive.store.texts.values()) == ["Equinor", "Jakke"]
+    assert archive.verify(data_dir) == []
+
+    # outputs missing in a fresh clone are restored, existing ones are left alone
+    data_dir.joinpath("interests-2020-02-27.json").unlink()
+    data_dir.joinpath("interests-2020-02-27.csv").unlink()
+    assert archive.restore_missing(data_dir) == ["2020-02-27"]
+    assert archive.restore_missing(data_dir) == []
+    assert archive.verify(data_dir) == []
@@ -0,0 +1,31 @@
+from benchmark import STAGES, corpus_documents, regressions, run_benchmark
+
+
+def test_benchmark_fixture():
+    result = run_benchmark(corpus_documents("fixture"), repeat=1, memory=False)
+    assert result["documents"] == ["testdata.json"]
+    assert list(result["stages"]) == list(STAGES)
+    assert result["reps"] > 0 and result["pages"] > 0
+    assert result["pages_per_second"] > 0
+
+    assert regressions(result, result) == []
+    faster = {**result, "stages": {stage: seconds / 2 for stage, seconds in result["stages"].items()}}
+    assert any(regression.startswith("xml_to_dict:") for regression in regressions(result, faster, threshold=0.25))
+
+
+def test_regressions_ignore_noisy_stages():
+    baseline = {"stages": {"flatten": 0.001, "parse": 1.0}, "peak_memory": 1000}
+    result = {"stages": {"flatten": 0.004, "parse": 1.2}, "peak_memory": 1500}
+    assert regressions(result, baseline, threshold=0.25) == ["peak_memory: 1500 bytes, baseline 1000 bytes"]
+
+
+def test_benchmark_writes_every_repeat(monkeypatch):
+    existed = []
+
+    def write_json(path, data):
+        existed.append(path.exists())
+        path.write_text("{}")
+
+    monkeypatch.setattr("benchmark.write_json", write_json)
+    run_benchmark(corpus_documents("fixture"), repeat=3, memory=True)
+    assert existed == [False] * 4
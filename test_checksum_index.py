@@ -0,0 +1,24 @@
+import os
+
+from checksum_index import ChecksumIndex
+from utils import file_checksum
+
+
+def test_checksum_index(tmp_path):
+    pdf = tmp_path.joinpath("interests-2020-03-23.pdf")
+    pdf.write_bytes(b"%PDF-1.4 test")
+    index_path = tmp_path.joinpath("checksums.json")
+
+    index = ChecksumIndex(index_path)
+    assert index.checksum(pdf) == file_checksum(pdf)
+    index.save()
+
+    # served from index while size and mtime are unchanged
+    index = ChecksumIndex(index_path)
+    index.entries[index.key(pdf)]["sha1"] = "stale"
+    assert index.checksum(pdf) == "stale"
+
+    # invalidated by size/mtime
+    pdf.write_bytes(b"%PDF-1.4 changed")
+    os.utime(pdf, ns=(0, 0))
+    assert index.checksum(pdf) == file_checksum(pdf)
@@ -0,0 +1,103 @@
+from classifier import LineClassifier, normalize_category
+from models import Page, TextRun
+from parser import InterestParser
+
+
+def text_run(left, text="", bold="", top=100):
+    return TextRun(top, left, 100, 13, 0, text, bold)
+
+
+def test_category_lookup():
+    classifier = LineClassifier(InterestParser.INTEREST_CATS, 106, 319)
+    assert normalize_category("Lønnet stilling m.v.") == normalize_category("Lønnet stilling mv.")
+    assert classifier.category_key("Lønnet stilling m.v.") == "4"
+    assert classifier.category_key("Aksjer mv") == "9"
+    assert classifier.category_key("§11  Gaver") == "11"
+    assert classifier.category_key("Selvstendig næ-", "ring") == "3"
+    # hyphenated over a page break
+    assert classifier.category_key("Økonomisk stø-") == "7"
+    assert classifier.category_key("Ukjent kategori") == "1"
+
+
+def test_shifted_columns():
+    pages = [
+        Page(
+            5,
+            (
+                text_run(106, bold="Representanter"),
+                text_run(106, bold="Aas, Johan (FrP, Oslo)"),
+                text_run(106, "§2"),
+                text_run(149, "Styreverv mv."),
+                text_run(319, "Styreleder Gamle Bæreiavegen boligsameie (lønnet)"),
+                text_run(780, "5", top=1186),
+            ),
+        ),
+        Page(
+            6,
+            (
+                text_run(126, bold="Berg, Kari (H, Hordaland)"),
+                text_run(126, "§9"),
+                text_run(169, "Aksjer m.v."),
+                text_run(339, "Equinor ASA"),
+                text_run(339, "Norsk Hydro ASA"),
+                text_run(780, "6", top=1186),
+            ),
+        ),
+    ]
+    assert InterestParser().parse_pdf_data(pages) == [
+        {
+            "first_name": "Johan",
+            "last_name": "Aas",
+            "party": "frp",
+            "by_category": {"2": "Styreleder Gamle Bæreiavegen boligsameie (lønnet)"},
+        },
+        {
+            "first_name": "Kari",
+            "last_name": "Berg",
+            "party": "h",
+            "by_category": {"9": "Equinor ASA\nNorsk Hydro ASA"},
+        },
+    ]
+
+
+def test_hyphenated_category_continuation():
+    pages = [
+        Page(
+            5,
+            (
+                text_run(106, bold="Representanter"),
+                text_run(106, bold="Aas, Johan (FrP, Oslo)"),
+                text_run(106, "Opplysninger om sel-"),
+                text_run(106, "skapsgjeld"),
+                text_run(319, "Lån i DNB"),
+                text_run(780, "5", top=1186),
+            ),
+        ),
+    ]
+    assert InterestParser().parse_pdf_data(pages) == [
+        {
+            "first_name": "Johan",
+            "last_name": "Aas",
+            "party": "frp",
+            "by_category": {"12": "Lån i DNB"},
+        },
+    ]
+
+
+def test_hyphenated_category_continuation_after_interest():
+    # the interest run on the line of the first part comes before the rest of the category name
+    pages = [
+        Page(
+            5,
+            (
+                text_run(106, bold="Representanter"),
+                text_run(106, bold="Aas, Johan (FrP, Oslo)"),
+                text_run(106, "Opplysninger om sel-", top=200),
+                text_run(319, "Lån i DNB", top=200),
+                text_run(106, "skapsgjeld", top=213),
+                text_run(319, "Lån i Nordea", top=213),
+                text_run(780, "5", top=1186),
+            ),
+        ),
+    ]
+    assert InterestParser().parse_pdf_data(pages)[0]["by_category"] == {"12": "Lån i DNB\nLån i Nordea"}
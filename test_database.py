@@ -0,0 +1,51 @@
+import json
+
+from database import InterestsDatabase
+from parser import InterestParser
+from settings import DATABASE_PATH
+from utils import write_csv
+
+
+def test_database_update_and_query(tmp_path):
+    legacy = [{"rep_number": "1", "first_name": "Johan", "last_name": "Aas", "party": "FrP", "Aksjer mv.": "Equinor"}]
+    tmp_path.joinpath("interests-2020-02-27.json").write_text(json.dumps(legacy))
+    current = {
+        "_meta": {"categories": InterestParser.INTEREST_CATS, "updated_at": "2020-03-23"},
+        "reps": [
+            {"first_name": "Johan", "last_name": "Aas", "party": "frp", "by_category": {"9": "Equinor", "11": "Jakke"}},
+            {"first_name": "Kari", "last_name": "Henriksen", "party": "a", "by_category": {"9": "Fond"}},
+        ],
+    }
+    current_path = tmp_path.joinpath("interests-2020-03-23.json")
+    current_path.write_text(json.dumps(current))
+
+    with InterestsDatabase(tmp_path.joinpath("interests.sqlite3")) as db:
+        assert db.update(tmp_path, InterestParser.INTEREST_CATS) == 2
+        assert db.update(tmp_path, InterestParser.INTEREST_CATS) == 0
+
+        assert db.rep_interests("Aas", "Johan", "Aksjer mv.") == [
+            ("2020-02-27", "Johan", "Aas", "frp", "Aksjer mv.", "Equinor"),
+            ("2020-03-23", "Johan", "Aas", "frp", "Aksjer mv.", "Equinor"),
+        ]
+        assert db.party_totals("9") == [
+            ("2020-02-27", "frp", "Aksjer mv.", 1),
+            ("2020-03-23", "a", "Aksjer mv.", 1),
+            ("2020-03-23", "frp", "Aksjer mv.", 1),
+        ]
+
+        # changed snapshot is re-imported
+        current["reps"].pop()
+        current_path.write_text(json.dumps(current))
+        assert db.update(tmp_path, InterestParser.INTEREST_CATS) == 1
+        assert db.rep_interests("Henriksen") == []
+
+
+def test_save_fills_empty_database(data_dir, tmp_path):
+    legacy = [{"rep_number": "1", "first_name": "Johan", "last_name": "Aas", "party": "FrP", "Aksjer mv.": "Equinor"}]
+    data_dir.joinpath("interests-2020-02-27.json").write_text(json.dumps(legacy))
+    write_csv(data_dir.joinpath("interests-2020-02-27.csv"), legacy, list(legacy[0]))
+    reps = [{"first_name": "Johan", "last_name": "Aas", "party": "frp", "by_category": {"9": "Equinor"}}]
+
+    InterestParser().save("2020-03-23", reps)
+    with InterestsDatabase(tmp_path.joinpath(DATABASE_PATH)) as db:
+        assert [row[0] for row in db.rep_interests("Aas")] == ["2020-02-27", "2020-03-23"]
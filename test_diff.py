@@ -0,0 +1,80 @@
+import json
+
+from diff import diff_reps, summarize_changes, write_changes
+from parser import InterestParser
+
+
+def rep(first_name, last_name, party, **by_category):
+    return {"first_name": first_name, "last_name": last_name, "party": party, "by_category": by_category}
+
+
+def test_diff_reps():
+    old = [rep("Johan", "Aas", "frp", **{"2": "Styreleder"}), rep("Kari", "Henriksen", "a", **{"9": "Fond"})]
+    new = [
+        rep("Johan", "Aas", "frp", **{"2": "Styremedlem", "9": "Equinor ASA"}),
+        rep("Elin Rodum", "Agdestein", "h", **{"8": "Fyrgt 3, Steinkjer"}),
+    ]
+    changes = diff_reps(old, new)
+    assert changes["added"] == [rep("Elin Rodum", "Agdestein", "h", **{"8": "Fyrgt 3, Steinkjer"})]
+    assert changes["removed"] == [{"first_name": "Kari", "last_name": "Henriksen", "party": "a"}]
+    assert changes["changed"] == [
+        {
+            "first_name": "Johan",
+            "last_name": "Aas",
+            "party": "frp",
+            "added": {"9": "Equinor ASA"},
+            "removed": {},
+            "modified": {"2": {"old": "Styreleder", "new": "Styremedlem"}},
+        }
+    ]
+
+
+def test_write_changes(tmp_path):
+    # snapshots before 2020-03-23 are lists of flattened reps
+    legacy = [{"rep_number": "1", "first_name": "Johan", "last_name": "Aas", "party": "FrP", "Aksjer mv.": "Equinor"}]
+    tmp_path.joinpath("interests-2020-02-27.json").write_text(json.dumps(legacy))
+    reps = [rep("Johan", "Aas", "frp", **{"9": "Equinor", "11": "Jakke"})]
+
+    assert write_changes("2020-02-27", reps, InterestParser.INTEREST_CATS, data_dir=tmp_path) is None
+    for _ in range(2):
+        changes_path = write_changes("2020-03-23", reps, InterestParser.INTEREST_CATS, data_dir=tmp_path)
+
+    changes = json.loads(changes_path.read_text())
+    assert changes["from"] == "2020-02-27"
+    assert changes["changed"][0]["added"] == {"11": "Jakke"}
+    assert changes["changed"][0]["modified"] == {}
+
+    changelog = tmp_path.joinpath("changes", "changelog.jsonl").read_text().splitlines()
+    assert [json.loads(line)["to"] for line in changelog] == ["2020-03-23"]
+
+
+def test_summarize_changes():
+    old = [rep("Johan", "Aas", "frp", **{"2": "Styreleder"}), rep("Kari", "Henriksen", "a", **{"9": "Fond"})]
+    new = [rep("Johan", "Aas", "frp", **{"2": "Styremedlem", "9": "Equinor ASA"})]
+    assert summarize_changes(diff_reps(old, new), InterestParser.INTEREST_CATS) == [
+        "- Henriksen, Kari (a)",
+        "~ Aas, Johan (frp): added Aksjer mv.; modified Styreverv mv.",
+    ]
+
+
+def test_write_changes_out_of_order(tmp_path):
+    def save(updated_at_str, reps):
+        snapshot_data = InterestParser.snapshot_data(updated_at_str, reps)
+        tmp_path.joinpath(f"interests-{updated_at_str}.json").write_text(json.dumps(snapshot_data))
+        return write_changes(updated_at_str, reps, InterestParser.INTEREST_CATS, data_dir=tmp_path)
+
+    def changelog():
+        lines = tmp_path.joinpath("changes", "changelog.jsonl").read_text().splitlines()
+        return [(summary["from"], summary["to"], summary["changed"]) for summary in map(json.loads, lines)]
+
+    save("2020-03-23", [rep("Johan", "Aas", "frp", **{"9": "Equinor"})])
+    save("2020-05-04", [rep("Johan", "Aas", "frp", **{"9": "Equinor", "11": "Jakke", "2": "Styreleder"})])
+    # an older register is inserted, the next change file is diffed against it
+    save("2020-04-20", [rep("Johan", "Aas", "frp", **{"9": "Equinor", "11": "Jakke"})])
+    changes = json.loads(tmp_path.joinpath("changes", "changes-2020-05-04.json").read_text())
+    assert (changes["from"], changes["changed"][0]["added"]) == ("2020-04-20", {"2": "Styreleder"})
+    assert changelog() == [("2020-03-23", "2020-04-20", 1), ("2020-04-20", "2020-05-04", 1)]
+
+    # a re-parsed register replaces its changelog line
+    save("2020-04-20", [rep("Johan", "Aas", "frp", **{"9": "Equinor", "11": "Jakke", "2": "Styreleder"})])
+    assert changelog() == [("2020-03-23", "2020-04-20", 1), ("2020-04-20", "2020-05-04", 0)]
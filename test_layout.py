@@ -0,0 +1,25 @@
+import json
+from pathlib import Path
+
+from layout import DocumentLayout
+from models import Page
+
+
+def test_layout_from_dicts_and_pages():
+    with Path("testdata.json").open() as fp:
+        dict_pages = json.load(fp)["pdf2xml"]["page"][3:6]
+    layout = DocumentLayout(dict_pages)
+    assert layout.num_pages == 3
+    pages = [Page.from_dict(page) for page in dict_pages]
+    model_layout = DocumentLayout(pages)
+    assert len(layout) == len(model_layout) == sum(len(page.texts) for page in pages)
+    assert layout.left == model_layout.left
+    assert layout.text == model_layout.text
+    assert layout.bold == model_layout.bold
+    assert layout.page_lengths() == [len(page.texts) for page in pages]
+
+    for page_idx, number in enumerate(["4", "5", "6"]):
+        start, end = layout.page_range(page_idx)
+        page_numbers = layout.page_number_mask(page_idx)
+        assert [layout.text[idx] for idx in range(start, end) if page_numbers[idx - start]] == [number]
+        assert sum(layout.histogram(page_idx, page_numbers).values()) == 1
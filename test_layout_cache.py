@@ -0,0 +1,31 @@
+import os
+
+from layout_cache import LayoutCache
+
+
+def test_layout_cache_get_put(tmp_path):
+    cache = LayoutCache(tmp_path)
+    assert cache.get("abc-0.62.0") is None
+
+    pdf_dict = {"pdf2xml": {"@version": "0.62.0", "page": [{"@number": "1", "text": [{"#text": "Ajourført"}]}]}}
+    cache.put("abc-0.62.0", pdf_dict)
+    assert cache.get("abc-0.62.0") == pdf_dict
+
+    cache.clear()
+    assert cache.get("abc-0.62.0") is None
+
+
+def test_layout_cache_lru_eviction(tmp_path):
+    pdf_dict = {"pdf2xml": {"page": [{"text": [{"#text": os.urandom(1024).hex()}]}]}}
+    cache = LayoutCache(tmp_path, max_bytes=1)
+    cache.put("a", pdf_dict)
+    cache.put("b", pdf_dict)
+    assert cache.get("a") is None
+    assert cache.get("b") == pdf_dict
+
+    cache = LayoutCache(tmp_path, max_bytes=len(cache.entry_path("b").read_bytes()) * 2 + 100)
+    cache.put("c", pdf_dict)
+    os.utime(cache.entry_path("b"), (0, 0))  # b least recently used
+    cache.get("c")
+    cache.put("d", pdf_dict)
+    assert [path.name for path in cache.entries()] == ["c.json.gz", "d.json.gz"]
@@ -0,0 +1,28 @@
+from manifest import ParseManifest
+
+
+def test_manifest_lookup(tmp_path):
+    pdf = tmp_path.joinpath("interests-2020-03-23.pdf")
+    pdf.write_bytes(b"%PDF-1.4 test")
+    output = tmp_path.joinpath("interests-2020-03-23.json")
+    manifest_path = tmp_path.joinpath("manifest.json")
+
+    manifest = ParseManifest.load(manifest_path, "1")
+    assert manifest.lookup(pdf) is None
+
+    manifest.record(pdf, "2020-03-23", [output])
+    manifest.save()
+    # output not written yet
+    assert ParseManifest.load(manifest_path, "1").lookup(pdf) is None
+
+    output.write_text("{}")
+    entry = ParseManifest.load(manifest_path, "1").lookup(pdf)
+    assert entry["updated_at"] == "2020-03-23"
+    assert entry["pdf"] == pdf.name
+
+    # new parser version invalidates
+    assert ParseManifest.load(manifest_path, "2").lookup(pdf) is None
+
+    # changed PDF invalidates
+    pdf.write_bytes(b"%PDF-1.4 changed")
+    assert ParseManifest.load(manifest_path, "1").lookup(pdf) is None
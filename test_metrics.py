@@ -0,0 +1,38 @@
+import json
+from pathlib import Path
+
+from metrics import Metrics, NULL_METRICS
+from parser import InterestParser
+
+
+def test_metrics_counts_per_document():
+    metrics = Metrics()
+    metrics.begin_document("a.pdf")
+    with metrics.stage("parse"):
+        metrics.count("reps", 2)
+    metrics.end_document(updated_at="2020-03-23")
+    metrics.merge({"stages": {"parse": {"seconds": 1.0, "calls": 1}}, "counters": {"reps": 3}, "documents": []})
+
+    data = metrics.as_dict()
+    assert data["stages"]["parse"]["calls"] == 2
+    assert data["stages"]["parse"]["seconds"] >= 1.0
+    assert data["counters"] == {"reps": 5}
+    assert data["documents"][0]["pdf"] == "a.pdf"
+    assert data["documents"][0]["counters"] == {"reps": 2}
+    assert data["documents"][0]["updated_at"] == "2020-03-23"
+
+
+def test_parser_metrics():
+    with Path("testdata.json").open() as fp:
+        pdf_dict = json.load(fp)
+    metrics = Metrics(profile=True)
+    parser = InterestParser(pdf_dict=pdf_dict, metrics=metrics)
+    with metrics.stage("parse", profile=True):
+        reps = parser.parse_pdf_data()
+
+    assert metrics.counters["reps"] == len(reps)
+    assert metrics.counters["rep_headers"] >= len(reps)
+    assert metrics.counters["text_runs"] > metrics.counters["rep_pages"] > 0
+    assert metrics.profiler.getstats()
+
+    assert InterestParser(pdf_dict=pdf_dict).metrics is NULL_METRICS
@@ -1,18 +1,23 @@
+import copy
 import datetime
 import json
+import multiprocessing
+import shutil
 from pathlib import Path
 
 import pytest
 from pytest import fixture
 
-from parser import InterestParser
-from utils import pdf_to_xml_dict
+from xml.etree import ElementTree
 
+import xmltodict
 
-@fixture
-def pdf_dict():
-    with Path("testdata.json").open() as fp:
-        return json.load(fp)
+from classifier import LineClassifier
+from manifest import ParseManifest
+from models import Page, TextRun
+from parser import InterestParser, parse_cli_args
+from settings import CACHE_DIR, MANIFEST_PATH, PDF_DIR
+from utils import pdf_to_xml_dict, xml_element_to_dict
 
 
 @fixture
@@ -89,3 +94,212 @@ def test_first_last_data(interest_parser):
     categories = jt[0]["by_category"]
     expected_cats = ["4", "7", "10", "11"]
     assert all([cat in categories for cat in expected_cats])
+
+
+def test_xml_element_to_dict(pdf_dict):
+    xml = xmltodict.unparse(pdf_dict)
+    pages = [xml_element_to_dict(page) for page in ElementTree.fromstring(xml).iter("page")]
+    assert pages == pdf_dict["pdf2xml"]["page"]
+
+
+def test_parse_pages_iterator(pdf_dict, interest_parser):
+    pages = iter(pdf_dict["pdf2xml"]["page"])
+    assert InterestParser().parse_pdf_data(pages) == interest_parser.parse_pdf_data()
+
+
+def test_parse_classifies_pages_as_they_arrive(pdf_dict, interest_parser, monkeypatch):
+    expected = interest_parser.parse_pdf_data()
+    read = []
+    classified = []
+    parsed = []
+
+    def stream():
+        for page in pdf_dict["pdf2xml"]["page"]:
+            read.append(page)
+            yield page
+
+    classify_page = LineClassifier.classify_page
+    category_key = LineClassifier.category_key
+
+    def record_classify(self, layout, page_idx):
+        classified.append(len(read))
+        return classify_page(self, layout, page_idx)
+
+    def record_category(self, content, next_content=None):
+        parsed.append(len(read))
+        return category_key(self, content, next_content)
+
+    monkeypatch.setattr("classifier.LineClassifier.classify_page", record_classify)
+    monkeypatch.setattr("classifier.LineClassifier.category_key", record_category)
+    assert InterestParser().parse_pdf_data(stream()) == expected
+    # each page is classified before the next one is read
+    assert classified == list(range(classified[0], len(read) + 1))
+    # and its runs are parsed before the next one is read
+    assert parsed[0] == classified[0]
+    assert set(parsed) <= set(classified)
+
+
+def test_probe_document_meta(pdf_dict, monkeypatch):
+    def first_page_only(pdf_path, first_page=None, last_page=None):
+        assert (first_page, last_page) == (1, 1)
+        return {"pdf2xml": {"page": pdf_dict["pdf2xml"]["page"][:1]}}
+
+    monkeypatch.setattr("parser.pdf_to_xml_dict", first_page_only)
+    meta = InterestParser().probe_document_meta(Path("pdfs/interests-2020-03-23.pdf"))
+    assert meta["updated_at"].isoformat() == "2020-03-23"
+
+
+def test_page_model(pdf_dict):
+    xml = xmltodict.unparse(pdf_dict)
+    pages = [Page.from_dict(page) for page in pdf_dict["pdf2xml"]["page"]]
+    assert pages == [Page.from_element(page) for page in ElementTree.fromstring(xml).iter("page")]
+
+    rep_header = [text for text in pages[4].texts if text.bold][2]
+    assert isinstance(rep_header, TextRun)
+    assert isinstance(rep_header.left, int)
+    assert rep_header.bold.startswith("Agdestein, Elin Rodum")
+
+
+def test_parse_bytes(pdf_dict, interest_parser, monkeypatch):
+    def piped(pdf, **kwargs):
+        assert pdf == b"%PDF-1.4"
+        return pdf_dict
+
+    monkeypatch.setattr("parser.pdf_to_xml_dict", piped)
+    meta, reps = InterestParser().parse_bytes(b"%PDF-1.4")
+    assert meta["updated_at"].isoformat() == "2020-03-23"
+    assert reps == interest_parser.parse_pdf_data()
+
+
+def test_verify_all(pdf_dict, interest_parser, data_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr("parser.pdf_to_xml_dict", lambda pdf, **kwargs: pdf_dict)
+    tmp_path.joinpath(PDF_DIR, "interests-2020-03-23.pdf").write_bytes(b"%PDF-1.4")
+
+    reps = interest_parser.parse_pdf_data()
+    [(pdf, updated_at_str, changes)] = InterestParser().verify_all()
+    # no output yet, all reps are new
+    assert (updated_at_str, len(changes["added"])) == ("2020-03-23", len(reps))
+
+    json_path = data_dir.joinpath("interests-2020-03-23.json")
+    json_path.write_text(json.dumps(InterestParser.snapshot_data("2020-03-23", reps)))
+    assert InterestParser().verify_all() == [(pdf, "2020-03-23", None)]
+
+    json_path.write_text(json.dumps(InterestParser.snapshot_data("2020-03-23", reps[1:])))
+    [(_, _, changes)] = InterestParser().verify_all()
+    assert [rep["last_name"] for rep in changes["added"]] == ["Agdestein"]
+    assert sorted(path.name for path in data_dir.iterdir()) == ["interests-2020-03-23.json"]
+
+
+def test_find_rep_with_page_index(pdf_dict, interest_parser, tmp_path, monkeypatch):
+    extracted = []
+
+    def page_range(pdf, first_page=None, last_page=None, **kwargs):
+        extracted.append((first_page, last_page))
+        pages = [page for page in pdf_dict["pdf2xml"]["page"] if (first_page or 1) <= int(page["@number"])]
+        return {"pdf2xml": {"page": [page for page in pages if int(page["@number"]) <= (last_page or len(pages))]}}
+
+    monkeypatch.setattr("parser.pdf_to_xml_dict", page_range)
+    monkeypatch.setattr("parser.DATA_DIR", tmp_path)
+    pdf = Path("interests-2020-03-23.pdf")
+
+    reps = interest_parser.parse_pdf_data()
+    [andersen] = [rep for rep in reps if rep["last_name"] == "Andersen" and rep["first_name"] == "Karin"]
+    # the index is built on first use
+    assert InterestParser().find_rep(pdf, "Andersen", "Karin") == [andersen]
+    assert tmp_path.joinpath("pages", "pages-2020-03-23.json").exists()
+
+    extracted.clear()
+    assert InterestParser().find_rep(pdf, "Andersen", "Karin") == [andersen]
+    # probe the date, then only the pages of the rep which spans a page break
+    assert extracted == [(1, 1), (5, 6)]
+    assert InterestParser().find_rep(pdf, "Nobody") == []
+
+
+def test_parse_all_retries_failed_parse(pdf_dict, data_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr("parser.pdf_to_xml_dict", lambda pdf, **kwargs: pdf_dict)
+    pdf = tmp_path.joinpath(PDF_DIR, "interests-2020-03-23.pdf")
+    pdf.write_bytes(b"%PDF-1.4")
+    manifest_path = tmp_path.joinpath(MANIFEST_PATH)
+    assert InterestParser().parse_all() == []
+    assert ParseManifest.load(manifest_path, InterestParser.PARSER_VERSION).lookup(pdf)
+
+    # a new parser version fails, the outputs of the old one are still there
+    parse_pdf_data = InterestParser.parse_pdf_data
+    monkeypatch.setattr("parser.InterestParser.PARSER_VERSION", "next")
+    monkeypatch.setattr("parser.InterestParser.parse_pdf_data", lambda self, pages=None: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        InterestParser().parse_all()
+    assert ParseManifest.load(manifest_path, "next").lookup(pdf) is None
+
+    monkeypatch.setattr("parser.InterestParser.parse_pdf_data", parse_pdf_data)
+    assert InterestParser().parse_all() == []
+    assert ParseManifest.load(manifest_path, "next").lookup(pdf)
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_context().get_start_method() != "fork",
+    reason="workers need the patched extraction",
+)
+def test_parse_all_jobs(pdf_dict, data_dir, tmp_path, monkeypatch):
+    registers = {
+        "interests-2020-03-23.pdf": "23. mars 2020",
+        "interests-2020-03-23-copy.pdf": "23. mars 2020",
+        "interests-2020-04-20.pdf": "20. april 2020",
+        "interests-2020-05-04.pdf": None,
+    }
+
+    def fake_pdf_to_xml_dict(pdf, first_page=None, **kwargs):
+        """testdata.json updated at the date of the register, a register without a date fails after the probe"""
+        updated_at = registers[pdf.name] or "4. mai 2020"
+        if registers[pdf.name] is None and first_page is None:
+            raise ValueError(f"Broken PDF {pdf.name}")
+        updated = copy.deepcopy(pdf_dict)
+        for text in updated["pdf2xml"]["page"][0]["text"]:
+            if "Ajourført" in text.get("#text", ""):
+                text["#text"] = f"Ajourført pr. {updated_at}"
+        return updated
+
+    monkeypatch.setattr("parser.pdf_to_xml_dict", fake_pdf_to_xml_dict)
+    pdf_dir = tmp_path.joinpath(PDF_DIR)
+    for name in registers:
+        pdf_dir.joinpath(name).write_bytes(b"%PDF-1.4 " + name.encode())
+
+    [(pdf, error)] = InterestParser().parse_all(jobs=2)
+    assert (pdf.name, str(error)) == ("interests-2020-05-04.pdf", "Broken PDF interests-2020-05-04.pdf")
+    parallel = {path.relative_to(data_dir): path.read_bytes() for path in data_dir.rglob("*") if path.is_file()}
+    assert {"interests-2020-03-23.json", "interests-2020-04-20.json"} <= {path.name for path in parallel}
+    assert not data_dir.joinpath("interests-2020-05-04.json").exists()
+
+    # the same outputs as a serial run without the broken PDF
+    pdf_dir.joinpath("interests-2020-05-04.pdf").unlink()
+    shutil.rmtree(data_dir)
+    shutil.rmtree(tmp_path.joinpath(CACHE_DIR), ignore_errors=True)
+    data_dir.mkdir()
+    assert InterestParser().parse_all() == []
+    serial = {path.relative_to(data_dir): path.read_bytes() for path in data_dir.rglob("*") if path.is_file()}
+    assert serial == parallel
+
+
+@pytest.mark.parametrize("flags", [["--all", "--jobs", "2"], ["--all", "--stream"], ["--verify"]])
+def test_shards_rejected(flags, monkeypatch, capsys):
+    monkeypatch.setattr("sys.argv", ["parser.py", "--shards", "4", *flags])
+    with pytest.raises(SystemExit):
+        parse_cli_args()
+    assert "--shards can not be combined" in capsys.readouterr().err
+    monkeypatch.setattr("sys.argv", ["parser.py", "--shards", "4", "--all"])
+    assert parse_cli_args().shards == 4
+
+
+def test_parse_all_restores_outputs_from_archive(pdf_dict, data_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr("parser.pdf_to_xml_dict", lambda pdf, **kwargs: pdf_dict)
+    tmp_path.joinpath(PDF_DIR, "interests-2020-03-23.pdf").write_bytes(b"%PDF-1.4")
+    assert InterestParser().parse_all() == []
+    outputs = {path: path.read_bytes() for path in data_dir.glob("interests-*")}
+    assert len(outputs) == 2
+
+    # a fresh clone only has the archive, the outputs are restored and the PDF is not parsed again
+    for path in outputs:
+        path.unlink()
+    monkeypatch.setattr("parser.pdf_to_xml_dict", lambda pdf, **kwargs: 1 / 0)
+    assert InterestParser().parse_all() == []
+    assert {path: path.read_bytes() for path in data_dir.glob("interests-*")} == outputs
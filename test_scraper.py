@@ -0,0 +1,49 @@
+import datetime
+import hashlib
+
+from checksum_index import ChecksumIndex
+from scraper import scrape
+from settings import CHECKSUM_INDEX_PATH
+
+LISTING = """
+<html><body>
+<a href="/globalassets/register-2021-01-27.pdf">Register per 27. januar 2021</a>
+<a href="/globalassets/register-2020-12-17.pdf">Register per 17. desember 2020</a>
+<a href="/om-registeret">Om registeret</a>
+</body></html>
+"""
+
+
+def test_scrape_downloads_concurrently(stand_in_site, data_dir, tmp_path, monkeypatch):
+    stand_in_site.pages = {
+        "/listing": LISTING.encode(),
+        "/globalassets/register-2021-01-27.pdf": b"%PDF-1.4 2021-01-27",
+        "/globalassets/register-2020-12-17.pdf": b"%PDF-1.4 2020-12-17",
+    }
+    # new PDFs are probed from the downloaded bytes
+    monkeypatch.setattr(
+        "parser.InterestParser.probe_document_meta",
+        lambda self, pdf: {"updated_at": datetime.date.fromisoformat(pdf.split()[1].decode())},
+    )
+
+    list_url = f"{stand_in_site.url}/listing"
+    to_parse = scrape(jobs=2, list_url=list_url, pdf_dir=tmp_path)
+    assert [path.name for path in to_parse] == ["interests-2020-12-17.pdf", "interests-2021-01-27.pdf"]
+    assert tmp_path.joinpath("interests-2021-01-27.pdf").read_bytes() == b"%PDF-1.4 2021-01-27"
+    # hashed while streaming, the checksum index is filled without reading the file back
+    checksum_index = ChecksumIndex(tmp_path.joinpath(CHECKSUM_INDEX_PATH))
+    assert checksum_index.entries[ChecksumIndex.key(tmp_path.joinpath("interests-2021-01-27.pdf"))]["sha1"] == (
+        hashlib.sha1(b"%PDF-1.4 2021-01-27").hexdigest()
+    )
+
+    # unchanged files are not transferred again
+    stand_in_site.requests.clear()
+    assert scrape(jobs=2, list_url=list_url, pdf_dir=tmp_path) == []
+    pdf_requests = [headers for path, headers in stand_in_site.requests if path.endswith(".pdf")]
+    assert len(pdf_requests) == 2
+    assert all("If-None-Match" in headers for headers in pdf_requests)
+
+    stand_in_site.pages["/globalassets/register-2020-12-17.pdf"] = b"%PDF-1.4 2020-12-17 corrected"
+    to_parse = scrape(jobs=2, list_url=list_url, pdf_dir=tmp_path)
+    assert [path.name for path in to_parse] == ["interests-2020-12-17.pdf"]
+    assert tmp_path.joinpath("interests-2020-12-17.pdf").read_bytes() == b"%PDF-1.4 2020-12-17 corrected"
@@ -0,0 +1,65 @@
+import json
+
+from parser import InterestParser
+from search import SearchIndex
+from settings import SEARCH_INDEX_PATH
+from utils import write_csv
+
+
+def test_search_index(tmp_path):
+    legacy = [
+        {"rep_number": "1", "first_name": "Johan", "last_name": "Aas", "party": "FrP", "Aksjer mv.": "Equinor ASA"}
+    ]
+    tmp_path.joinpath("interests-2020-02-27.json").write_text(json.dumps(legacy))
+    current = {
+        "_meta": {"categories": InterestParser.INTEREST_CATS, "updated_at": "2020-03-23"},
+        "reps": [
+            {
+                "first_name": "Johan",
+                "last_name": "Aas",
+                "party": "frp",
+                "by_category": {"9": "Equinor ASA\nNorsk Hydro ASA", "2": "Styreleder Hydro Energi AS"},
+            },
+            {"first_name": "Kari", "last_name": "Henriksen", "party": "a", "by_category": {"9": "Hydro Norsk AS"}},
+        ],
+    }
+    tmp_path.joinpath("interests-2020-03-23.json").write_text(json.dumps(current))
+
+    index_path = tmp_path.joinpath("search_index.json.gz")
+    index = SearchIndex(index_path)
+    assert index.build(tmp_path, InterestParser.INTEREST_CATS) == 2
+    assert index.save()
+    assert not index.save()
+
+    index = SearchIndex(index_path)
+    hits = index.search("equinor")
+    assert [(hit["updated_at"], hit["last_name"], hit["category"]) for hit in hits] == [
+        ("2020-02-27", "Aas", "9"),
+        ("2020-03-23", "Aas", "9"),
+    ]
+    assert len(index.search("equi*")) == 2
+    assert len(index.search("hydro")) == 3
+    assert len(index.search("hydro", category="9")) == 2
+    # phrases match words in order, also over line breaks
+    assert [hit["last_name"] for hit in index.search('"norsk hydro"')] == ["Aas"]
+    assert [hit["last_name"] for hit in index.search('"asa norsk"')] == ["Aas"]
+    assert [hit["last_name"] for hit in index.search('"hydro nor*"')] == ["Henriksen"]
+    assert [hit["category"] for hit in index.search('hydro "energi as"')] == ["2"]
+    assert index.search("statkraft") == []
+
+    # adding a snapshot again replaces its records
+    index.add_reps("2020-03-23", current["reps"][1:])
+    assert [hit["last_name"] for hit in index.search("hydro")] == ["Henriksen"]
+    index.add_reps("2020-04-01", current["reps"][:1])
+    assert [hit["updated_at"] for hit in index.search("equinor")] == ["2020-02-27", "2020-04-01"]
+
+
+def test_save_builds_missing_index(data_dir, tmp_path):
+    legacy = [{"rep_number": "1", "first_name": "Johan", "last_name": "Aas", "party": "FrP", "Aksjer mv.": "Equinor"}]
+    data_dir.joinpath("interests-2020-02-27.json").write_text(json.dumps(legacy))
+    write_csv(data_dir.joinpath("interests-2020-02-27.csv"), legacy, list(legacy[0]))
+    reps = [{"first_name": "Johan", "last_name": "Aas", "party": "frp", "by_category": {"9": "Equinor ASA"}}]
+
+    InterestParser().save("2020-03-23", reps)
+    index = SearchIndex(tmp_path.joinpath(SEARCH_INDEX_PATH))
+    assert [hit["updated_at"] for hit in index.search("equinor")] == ["2020-02-27", "2020-03-23"]
@@ -0,0 +1,59 @@
+import json
+
+from parser import InterestParser
+from timelines import Timelines, timeline_key
+
+
+def write_snapshot(data_dir, updated_at_str, reps):
+    data_dir.joinpath(f"interests-{updated_at_str}.json").write_text(
+        json.dumps(InterestParser.snapshot_data(updated_at_str, reps))
+    )
+
+
+def test_timelines_incremental(tmp_path):
+    data_dir = tmp_path.joinpath("data")
+    data_dir.mkdir()
+    aas = {"first_name": "Johan", "last_name": "Aas", "party": "frp", "by_category": {"9": "Equinor"}}
+    berg = {"first_name": "Kari", "last_name": "Berg", "party": "h", "by_category": {"2": "Styreleder"}}
+    snapshots = [
+        ("2020-01-01", [aas, berg]),
+        ("2020-02-01", [{**aas, "by_category": {"9": "Equinor", "11": "Jakke"}}]),
+        ("2020-03-01", [aas, berg]),
+    ]
+
+    timelines = Timelines(tmp_path.joinpath("timelines"))
+    for updated_at_str, reps in snapshots:
+        write_snapshot(data_dir, updated_at_str, reps)
+        timelines.add(updated_at_str, reps, data_dir)
+
+    assert timeline_key(aas) == "aas-johan-frp"
+    assert timelines.get(aas) == {
+        "first_name": "Johan",
+        "last_name": "Aas",
+        "party": "frp",
+        "registered": [{"from": "2020-01-01", "to": "2020-03-01"}],
+        "categories": {
+            "9": [{"from": "2020-01-01", "to": "2020-03-01", "text": "Equinor"}],
+            "11": [{"from": "2020-02-01", "to": "2020-02-01", "text": "Jakke"}],
+        },
+    }
+    assert timelines.get(berg)["registered"] == [
+        {"from": "2020-01-01", "to": "2020-01-01"},
+        {"from": "2020-03-01", "to": "2020-03-01"},
+    ]
+
+    # unchanged snapshots are skipped, only reps of a new snapshot are written
+    assert timelines.add("2020-03-01", [aas, berg], data_dir) == 0
+    write_snapshot(data_dir, "2020-04-01", [berg])
+    assert timelines.add("2020-04-01", [berg], data_dir) == 1
+    incremental = {path.name: path.read_text() for path in timelines.timelines_dir.iterdir()}
+
+    # same result as a rebuild
+    rebuilt = Timelines(tmp_path.joinpath("rebuilt"))
+    assert rebuilt.build(data_dir) == 2
+    assert {path.name: path.read_text() for path in rebuilt.timelines_dir.iterdir()} == incremental
+
+    # a corrected older snapshot rebuilds all timelines
+    write_snapshot(data_dir, "2020-02-01", [aas, berg])
+    timelines.add("2020-02-01", [aas, berg], data_dir)
+    assert timelines.get(berg)["registered"] == [{"from": "2020-01-01", "to": "2020-04-01"}]
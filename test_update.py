@@ -0,0 +1,92 @@
+import copy
+import json
+import re
+
+from settings import PDF_DIR, TIMELINES_DIR
+from update import Updater
+
+LISTING = b"""
+<html><body>
+<a href="/globalassets/register-2020-04-20.pdf">Register per 20. april 2020</a>
+<a href="/globalassets/register-2020-03-23.pdf">Register per 23. mars 2020</a>
+</body></html>
+"""
+DATE_PATTERN = re.compile(r"\d+\. \w+ \d{4}")
+
+
+def dated_pdf_dict(pdf_dict, pdf):
+    """testdata.json updated at the date in the PDF bytes"""
+    updated = copy.deepcopy(pdf_dict)
+    for text in updated["pdf2xml"]["page"][0]["text"]:
+        if "Ajourført" in text.get("#text", ""):
+            text["#text"] = f"Ajourført pr. {DATE_PATTERN.search(pdf.decode()).group()}"
+    return updated
+
+
+def test_update_pipeline(stand_in_site, pdf_dict, data_dir, tmp_path, monkeypatch, capsys):
+    stand_in_site.pages = {
+        "/listing": LISTING,
+        "/globalassets/register-2020-04-20.pdf": b"%PDF-1.4 20. april 2020",
+        "/globalassets/register-2020-03-23.pdf": b"%PDF-1.4 23. mars 2020",
+    }
+
+    monkeypatch.setattr("parser.pdf_to_xml_dict", lambda pdf, **kwargs: dated_pdf_dict(pdf_dict, pdf))
+    pdf_dir = tmp_path.joinpath(PDF_DIR)
+
+    list_url = f"{stand_in_site.url}/listing"
+    updater = Updater(list_url=list_url, pdf_dir=pdf_dir, jobs=2, parse_jobs=2, queue_size=1)
+    assert updater.run() == ["2020-03-23", "2020-04-20"]
+    assert updater.failed == []
+    assert json.loads(data_dir.joinpath("interests-2020-04-20.json").read_text())["_meta"]["updated_at"] == "2020-04-20"
+    assert data_dir.joinpath("pages", "pages-2020-03-23.json").exists()
+    assert json.loads(tmp_path.joinpath(TIMELINES_DIR, "index.json").read_text())["snapshots"].keys() == {
+        "2020-03-23",
+        "2020-04-20",
+    }
+    assert {"download", "parse", "write", "wall"} <= updater.metrics.stages.keys()
+    assert updater.metrics.counters["parse"] == 2
+    updater.print_summary()
+    assert "NEW: 2" in capsys.readouterr().out
+
+    # unchanged registers are neither transferred nor parsed again
+    stand_in_site.requests.clear()
+    updater = Updater(list_url=list_url, pdf_dir=pdf_dir, jobs=2)
+    assert updater.run() == []
+    assert len(updater.unchanged) == 2
+    assert updater.metrics.counters["parse"] == 0
+    pdf_requests = [headers for path, headers in stand_in_site.requests if path.endswith(".pdf")]
+    assert len(pdf_requests) == 2
+    assert all("If-None-Match" in headers for headers in pdf_requests)
+
+    stand_in_site.pages["/globalassets/register-2020-03-23.pdf"] = b"%PDF-1.4 23. mars 2020 corrected"
+    updater = Updater(list_url=list_url, pdf_dir=pdf_dir, jobs=2)
+    assert updater.run() == ["2020-03-23"]
+    assert updater.unchanged == [pdf_dir.joinpath("interests-2020-04-20.pdf")]
+
+
+def test_update_retries_failed_parse(stand_in_site, pdf_dict, data_dir, tmp_path, monkeypatch):
+    stand_in_site.pages = {
+        "/listing": LISTING,
+        "/globalassets/register-2020-04-20.pdf": b"%PDF-1.4 20. april 2020",
+        "/globalassets/register-2020-03-23.pdf": b"%PDF-1.4 23. mars 2020",
+    }
+    failing = {b"%PDF-1.4 20. april 2020"}
+
+    def fake_pdf_to_xml_dict(pdf, **kwargs):
+        if pdf in failing:
+            raise ValueError("pdftohtml failed")
+        return dated_pdf_dict(pdf_dict, pdf)
+
+    monkeypatch.setattr("parser.pdf_to_xml_dict", fake_pdf_to_xml_dict)
+    pdf_dir = tmp_path.joinpath(PDF_DIR)
+    list_url = f"{stand_in_site.url}/listing"
+    updater = Updater(list_url=list_url, pdf_dir=pdf_dir, jobs=2)
+    assert updater.run() == ["2020-03-23"]
+    assert updater.failed == [pdf_dir.joinpath("interests-2020-04-20.pdf")]
+
+    # the server answers 304, but the PDF has no manifest entry and is parsed from disk
+    failing.clear()
+    updater = Updater(list_url=list_url, pdf_dir=pdf_dir, jobs=2)
+    assert updater.run() == ["2020-04-20"]
+    assert updater.unchanged == [pdf_dir.joinpath("interests-2020-03-23.pdf")]
+    assert data_dir.joinpath("interests-2020-04-20.json").exists()
@@ -0,0 +1,129 @@
+import copy
+import gzip
+import json
+import sys
+from pathlib import Path
+
+import pytest
+import requests
+
+from parser import InterestParser
+from utils import (
+    as_list,
+    fetch,
+    iter_pdf_pages,
+    merge_shards,
+    shard_page_ranges,
+    write_csv,
+    write_if_changed,
+    write_json,
+    write_json_gz,
+)
+
+
+def test_write_if_changed(tmp_path):
+    path = tmp_path.joinpath("out.txt")
+    assert write_if_changed(path, b"abc")
+    mtime = path.stat().st_mtime_ns
+    assert not write_if_changed(path, b"abc")
+    assert path.stat().st_mtime_ns == mtime
+    assert write_if_changed(path, b"abd")
+    assert path.read_bytes() == b"abd"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.txt"]
+
+
+def test_write_outputs(tmp_path):
+    data = [{"first_name": "Åse", "last_name": "Aas"}]
+    json_path = tmp_path.joinpath("out.json")
+    assert write_json(json_path, data)
+    assert not write_json(json_path, data)
+    assert json_path.read_text() == json.dumps(data, ensure_ascii=False, indent=2)
+
+    csv_path = tmp_path.joinpath("out.csv")
+    assert write_csv(csv_path, data, ["first_name", "last_name"])
+    assert not write_csv(csv_path, data, ["first_name", "last_name"])
+    assert csv_path.read_bytes() == "first_name,last_name\r\nÅse,Aas\r\n".encode("utf-8")
+
+    gz_path = tmp_path.joinpath("out.json.gz")
+    assert write_json_gz(gz_path, data)
+    assert not write_json_gz(gz_path, data)
+    assert json.loads(gzip.decompress(gz_path.read_bytes())) == data
+
+
+def shard(pdf_dict, first_page, last_page):
+    """Pages first_page..last_page as a pdftohtml run over that range would number and declare their fonts"""
+    fontspecs = {
+        fontspec["@id"]: fontspec for page in pdf_dict["pdf2xml"]["page"] for fontspec in as_list(page.get("fontspec"))
+    }
+    local_ids = {}
+    pages = []
+    for page in copy.deepcopy(pdf_dict["pdf2xml"]["page"][first_page - 1 : last_page]):
+        page.pop("fontspec", None)
+        declared = []
+        for text in as_list(page.get("text")):
+            if text["@font"] not in local_ids:
+                local_ids[text["@font"]] = str(len(local_ids))
+                declared.append({**fontspecs[text["@font"]], "@id": local_ids[text["@font"]]})
+            text["@font"] = local_ids[text["@font"]]
+        if declared:
+            page["fontspec"] = declared
+        pages.append(page)
+    return {"pdf2xml": {**pdf_dict["pdf2xml"], "page": pages}}
+
+
+def test_merge_shards():
+    with Path("testdata.json").open() as fp:
+        pdf_dict = json.load(fp)
+    page_ranges = shard_page_ranges(len(pdf_dict["pdf2xml"]["page"]), 4)
+    assert page_ranges == [(1, 19), (20, 38), (39, 56), (57, 74)]
+
+    merged = merge_shards([shard(pdf_dict, *page_range) for page_range in page_ranges])
+    assert InterestParser(pdf_dict=merged).parse_pdf_data() == InterestParser(pdf_dict=pdf_dict).parse_pdf_data()
+
+    def font_attributes(pdf_dict):
+        fontspecs = {
+            fontspec["@id"]: (fontspec["@size"], fontspec["@family"], fontspec["@color"])
+            for page in pdf_dict["pdf2xml"]["page"]
+            for fontspec in as_list(page.get("fontspec"))
+        }
+        return [fontspecs[text["@font"]] for page in pdf_dict["pdf2xml"]["page"] for text in as_list(page.get("text"))]
+
+    assert font_attributes(merged) == font_attributes(pdf_dict)
+    assert shard_page_ranges(10, 4) == [(1, 10)]
+
+
+def test_iter_pdf_pages_failure(monkeypatch):
+    # pdftohtml stand-in that gets through the first page of a damaged PDF
+    script = (
+        "import sys;"
+        "sys.stdout.write(\"<pdf2xml><page number='1'><text>Ajourført</text></page>\");"
+        "sys.stderr.write('Syntax Error: Invalid XRef entry');"
+        "sys.exit(1)"
+    )
+    monkeypatch.setattr("utils.pdftohtml_args", lambda file_path: [sys.executable, "-c", script])
+    pages = iter_pdf_pages(Path("interests-2020-03-23.pdf"))
+    assert next(pages)["@number"] == "1"
+    with pytest.raises(RuntimeError, match="interests-2020-03-23.pdf: Syntax Error: Invalid XRef entry"):
+        next(pages)
+
+
+def test_fetch_records_validators_after_download(stand_in_site, tmp_path):
+    url = f"{stand_in_site.url}/register.pdf"
+    path = tmp_path.joinpath("register.pdf")
+    http_state = {}
+    stand_in_site.pages["/register.pdf"] = b"%PDF-1.4 v1"
+    assert fetch(url, path, http_state=http_state) == b"%PDF-1.4 v1"
+    etag = http_state[url]["etag"]
+
+    # a corrected register of the same size breaks off, the validators of the old file are kept
+    stand_in_site.pages["/register.pdf"] = b"%PDF-1.4 v2"
+    stand_in_site.broken.add("/register.pdf")
+    with pytest.raises(requests.exceptions.RequestException):
+        fetch(url, path, http_state=http_state)
+    assert http_state[url]["etag"] == etag
+    assert path.read_bytes() == b"%PDF-1.4 v1"
+
+    stand_in_site.broken.clear()
+    assert fetch(url, path, http_state=http_state) == b"%PDF-1.4 v2"
+    assert http_state[url]["etag"] != etag
+    assert fetch(url, path, http_state=http_state) is None
@@ -0,0 +1,60 @@
+import json
+import threading
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+from settings import TIMELINES_DIR
+from watch import SnapshotCache, Watcher, make_server
+
+LISTING = b'<html><body><a href="/globalassets/register.pdf">Register per 23. mars 2020</a></body></html>'
+
+
+def get(url, etag=None):
+    request = Request(url, headers={"If-None-Match": etag} if etag else {})
+    try:
+        with urlopen(request) as response:
+            return response.status, response.headers["ETag"], json.loads(response.read())
+    except HTTPError as e:
+        return e.code, e.headers["ETag"], None
+
+
+def test_watch_serves_new_registers(stand_in_site, pdf_dict, data_dir, tmp_path, monkeypatch):
+    stand_in_site.pages = {"/listing": LISTING, "/globalassets/register.pdf": b"%PDF-1.4"}
+    monkeypatch.setattr("parser.pdf_to_xml_dict", lambda pdf, **kwargs: pdf_dict)
+
+    cache = SnapshotCache(data_dir, max_entries=1)
+    watcher = Watcher(cache, list_url=f"{stand_in_site.url}/listing", pdf_dir=tmp_path, jobs=1)
+    assert watcher.poll() == ["2020-03-23"]
+    assert watcher.poll() == []
+    # a corrected register is parsed again although its date has outputs
+    stand_in_site.pages["/globalassets/register.pdf"] = b"%PDF-1.4 corrected"
+    assert watcher.poll() == ["2020-03-23"]
+    assert watcher.poll() == []
+
+    server = make_server(cache, port=0, timelines_dir=tmp_path.joinpath(TIMELINES_DIR))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        assert get(f"{url}/snapshots")[2] == ["2020-03-23"]
+        status, etag, snapshot = get(f"{url}/snapshots/latest")
+        assert status == 200
+        assert snapshot["_meta"]["updated_at"] == "2020-03-23"
+        assert get(f"{url}/snapshots/2020-03-23", etag)[:2] == (304, etag)
+        assert get(f"{url}/snapshots/2013-04-18")[0] == 404
+
+        status, _, reps = get(f"{url}/reps?last_name=Aas&first_name=Johan")
+        assert reps["reps"] == [
+            {
+                "first_name": "Johan",
+                "last_name": "Aas",
+                "party": "frp",
+                "by_category": {"2": "Styreleder Gamle Bæreiavegen boligsameie (lønnet)"},
+            }
+        ]
+
+        timeline = get(f"{url}/timelines/aas-johan-frp")[2]
+        assert timeline["registered"] == [{"from": "2020-03-23", "to": "2020-03-23"}]
+        assert get(f"{url}/timelines/..%2Finterests-2020-03-23")[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
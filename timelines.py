@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import argparse
+import hashlib
+import json
+import re
+from pathlib import Path
+
+from archive import SnapshotArchive
+from settings import DATA_DIR, TIMELINES_DIR
+from snapshots import load_snapshot, snapshot_date, snapshot_paths
+from utils import dumps_json, read_json, write_json
+
+INDEX_FILE_NAME = "index.json"
+
+
+def timeline_key(rep):
+    """File name stem of a rep's timeline from the normalized name and party, e.g. aas-johan-frp"""
+    return re.sub(r"\W+", "-", f"{rep['last_name']} {rep['first_name']} {rep['party']}".casefold()).strip("-")
+
+
+def snapshot_checksum(reps):
+    return hashlib.sha1(dumps_json(reps, compact=True).encode("utf-8")).hexdigest()
+
+
+def extend_intervals(intervals, updated_at_str, previous, **fields):
+    """Extend the last interval to updated_at_str if it has fields and lasted until previous, else start a new one"""
+    if intervals:
+        last = intervals[-1]
+        if last["to"] == previous and all(last[name] == value for name, value in fields.items()):
+            last["to"] = updated_at_str
+            return
+    intervals.append({"from": updated_at_str, "to": updated_at_str, **fields})
+
+
+class Timelines:
+    """
+    One JSON file per representative, with the snapshot intervals the rep is registered in and the intervals each
+    category text was in effect. Intervals are inclusive, from the first to the last snapshot with the text.
+
+    Snapshots are added newest last: only the timelines of reps in the new snapshot are read and written. The first
+    snapshot added, an older snapshot or a changed version of an added one rebuild all timelines from the snapshots in
+    data_dir instead, so snapshots have to be written to data_dir before they are added.
+    """
+
+    def __init__(self, timelines_dir: Path = TIMELINES_DIR):
+        self.timelines_dir = timelines_dir
+        self.index_path = timelines_dir.joinpath(INDEX_FILE_NAME)
+        # updated_at -> checksum of the reps added
+        self.snapshots = read_json(self.index_path, default={"snapshots": {}})["snapshots"]
+
+    def path(self, key):
+        return self.timelines_dir.joinpath(f"{key}.json")
+
+    def get(self, rep):
+        """Timeline of rep (dict with first_name, last_name and party), None if the rep is in no snapshot"""
+        return read_json(self.path(timeline_key(rep)))
+
+    def add(self, updated_at_str, reps, data_dir: Path = DATA_DIR, categories=None):
+        """Add the reps of snapshot updated_at_str, returns the number of timelines written"""
+        checksum = snapshot_checksum(reps)
+        if self.snapshots.get(updated_at_str) == checksum:
+            return 0
+        if not self.snapshots or updated_at_str <= max(self.snapshots):
+            return self.build(data_dir, categories)
+
+        previous = max(self.snapshots)
+        timelines = {}
+        for rep in reps:
+            key = timeline_key(rep)
+            if key not in timelines:
+                timelines[key] = read_json(self.path(key))
+            timelines[key] = self.apply(timelines[key], updated_at_str, previous, rep)
+        self.snapshots[updated_at_str] = checksum
+        return self.write(timelines)
+
+    def build(self, data_dir: Path = DATA_DIR, categories=None):
+        """Rebuild all timelines from the snapshots in data_dir, returns the number of timelines written"""
+        timelines = {}
+        snapshots = {}
+        previous = None
+        for json_path in snapshot_paths(data_dir):
+            updated_at_str = snapshot_date(json_path)
+            reps = load_snapshot(json_path, categories)
+            for rep in reps:
+                key = timeline_key(rep)
+                timelines[key] = self.apply(timelines.get(key), updated_at_str, previous, rep)
+            snapshots[updated_at_str] = snapshot_checksum(reps)
+            previous = updated_at_str
+
+        if self.timelines_dir.exists():
+            for path in self.timelines_dir.glob("*.json"):
+                if path.stem not in timelines and path.name != INDEX_FILE_NAME:
+                    path.unlink()
+        self.snapshots = snapshots
+        return self.write(timelines)
+
+    @staticmethod
+    def apply(timeline, updated_at_str, previous, rep):
+        """Extend timeline (None for a new rep) with rep as registered in snapshot updated_at_str"""
+        if timeline is None:
+            timeline = {"first_name": "", "last_name": "", "party": "", "registered": [], "categories": {}}
+        # names as last registered, the key only has the normalized name
+        timeline.update({"first_name": rep["first_name"], "last_name": rep["last_name"], "party": rep["party"]})
+
+        # a rep can be listed twice in a snapshot, the first listing wins
+        registered = timeline["registered"]
+        if registered and registered[-1]["to"] == updated_at_str:
+            return timeline
+        extend_intervals(registered, updated_at_str, previous)
+        for category, text in rep["by_category"].items():
+            extend_intervals(timeline["categories"].setdefault(category, []), updated_at_str, previous, text=text)
+        return timeline
+
+    def write(self, timelines):
+        self.timelines_dir.mkdir(parents=True, exist_ok=True)
+        written = sum(write_json(self.path(key), timeline) for key, timeline in timelines.items())
+        write_json(self.index_path, {"snapshots": dict(sorted(self.snapshots.items()))})
+        return written
+
+
+def parse_cli_args():
+    p = argparse.ArgumentParser(description="Per representative timelines of interests over all snapshots")
+    p.add_argument("--build", action="store_true", default=False, help="Rebuild all timelines from data/")
+    p.add_argument("--rep", help='Print timelines of representative, "Last name" or "Last name, First name"')
+
+    args = p.parse_args()
+    if not args.build and not args.rep:
+        p.error("Give --build or --rep")
+    return args
+
+
+if __name__ == "__main__":
+    from parser import InterestParser
+
+    args = parse_cli_args()
+    timelines = Timelines()
+    if args.build:
+        SnapshotArchive().restore_missing()
+        print(f"Wrote {timelines.build(categories=InterestParser.INTEREST_CATS)} timelines")
+    if args.rep:
+        last_name, _, first_name = args.rep.partition(",")
+        prefix = timeline_key({"last_name": last_name, "first_name": first_name, "party": ""})
+        for path in sorted(timelines.timelines_dir.glob(f"{prefix}-*.json")):
+            if path.name != INDEX_FILE_NAME:
+                print(json.dumps(read_json(path), ensure_ascii=False, indent=2))
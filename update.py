@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import argparse
+import threading
+from pathlib import Path
+from queue import Queue
+from time import perf_counter
+
+from checksum_index import ChecksumIndex
+from manifest import ParseManifest
+from metrics import Metrics
+from parser import InterestParser
+from scraper import PDF_LIST_URL, list_pdfs
+from settings import CHECKSUM_INDEX_PATH, HTTP_STATE_FILE_NAME, MANIFEST_PATH, PDF_DIR
+from utils import fetch, make_session, read_json, write_json
+
+STAGES = ("list", "download", "parse", "write")
+DONE = None  # queue sentinel, one per worker of the receiving stage
+
+
+class Updater:
+    """
+    Scrape, download, parse and write new registers in one run, as concurrent stages linked by bounded queues.
+
+    Download workers hand the bytes of each new or changed PDF straight to the parse workers, so a register is parsed
+    while later ones are still downloading. Full queues block the stage before them, which keeps at most queue_size
+    PDFs waiting per stage in memory. The single writer saves snapshots in register date order, so the incremental
+    outputs (changes, timelines) see them oldest first as in `parser.py --all`.
+
+    Every worker has its own Metrics, stage busy time and the time blocked on a full downstream queue are summed into
+    self.metrics when the run is done.
+    """
+
+    def __init__(
+        self, list_url=PDF_LIST_URL, pdf_dir: Path = PDF_DIR, jobs=4, parse_jobs=2, queue_size=2, verbose=False
+    ):
+        self.list_url = list_url
+        self.pdf_dir = pdf_dir
+        self.jobs = jobs
+        self.parse_jobs = parse_jobs
+        self.queue_size = queue_size
+        self.verbose = verbose
+        self.session = make_session(pool_size=jobs)
+        self.http_state_path = pdf_dir.joinpath(HTTP_STATE_FILE_NAME)
+        self.http_state = read_json(self.http_state_path, default={})
+        self.checksum_index = ChecksumIndex(CHECKSUM_INDEX_PATH)
+        self.manifest = ParseManifest.load(MANIFEST_PATH, InterestParser.PARSER_VERSION, self.checksum_index)
+        self.writer = InterestParser(verbose=verbose)
+        self.metrics = Metrics()
+        self.workers = {stage: 1 for stage in STAGES}
+        self.workers.update({"download": jobs, "parse": parse_jobs})
+        self.worker_metrics = []
+        self.local = threading.local()
+        self.pending = {}  # parsed out of order, by seq
+        self.next_seq = 0
+        self.written = []
+        self.unchanged = []
+        self.failed = []
+
+    def run(self):
+        """Run all stages until every listed PDF is written or skipped, returns the dates of written snapshots"""
+        start = perf_counter()
+        # the manifest only knows PDFs as unchanged if their outputs exist
+        self.writer.restore_outputs()
+        download_queue = Queue(self.queue_size)
+        parse_queue = Queue(self.queue_size)
+        write_queue = Queue(self.queue_size)
+
+        downloaders = self.start_workers("download", self.download, download_queue, parse_queue, write_queue)
+        parsers = self.start_workers("parse", self.parse, parse_queue, write_queue)
+        writers = self.start_workers("write", self.write, write_queue)
+
+        metrics = self.new_metrics()
+        with metrics.stage("list"):
+            pdfs = list_pdfs(self.session, self.list_url, self.pdf_dir)
+        metrics.count("list", len(pdfs))
+        print(f"Found {len(pdfs)} pdfs...")
+
+        # oldest first, file names carry the listed register date
+        for seq, pdf in enumerate(sorted(pdfs, key=lambda pdf: pdf["file_name"])):
+            self.put(metrics, "list", download_queue, dict(pdf, seq=seq))
+        self.stop_workers(downloaders, download_queue)
+        self.stop_workers(parsers, parse_queue)
+        self.stop_workers(writers, write_queue)
+
+        write_json(self.http_state_path, dict(sorted(self.http_state.items())))
+        self.checksum_index.save()
+        self.manifest.save()
+
+        for worker_metrics in self.worker_metrics:
+            self.metrics.merge(worker_metrics.as_dict())
+        self.metrics.add_stage("wall", perf_counter() - start)
+        return self.written
+
+    def new_metrics(self):
+        metrics = Metrics()
+        self.worker_metrics.append(metrics)
+        return metrics
+
+    def start_workers(self, stage, handle, in_queue, *out_queues):
+        threads = []
+        for _ in range(self.workers[stage]):
+            thread = threading.Thread(
+                target=self.work, args=(stage, handle, self.new_metrics(), in_queue, *out_queues), daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    @staticmethod
+    def stop_workers(threads, in_queue):
+        for _ in threads:
+            in_queue.put(DONE)
+        for thread in threads:
+            thread.join()
+
+    @staticmethod
+    def put(metrics, stage, queue, item):
+        """Put item on a downstream queue, the time spent waiting for room is backpressure on stage"""
+        with metrics.stage(f"{stage}_blocked"):
+            queue.put(item)
+
+    def work(self, stage, handle, metrics, in_queue, *out_queues):
+        """
+        Worker loop of stage: handle items until the sentinel, handle returns the index of the out queue to put the
+        item on, or None when the item goes nowhere else
+        """
+        while True:
+            item = in_queue.get()
+            if item is DONE:
+                return
+            with metrics.stage(stage):
+                try:
+                    out = handle(item)
+                except Exception as e:
+                    print(f"Failed {stage} of '{item['file_name']}': {e!r}")
+                    self.failed.append(item["file_name"])
+                    # the writer still has to see the item to keep writing in order
+                    item = {"seq": item["seq"], "file_name": item["file_name"]}
+                    out = len(out_queues) - 1 if out_queues else None
+            metrics.count(stage)
+            if out is not None:
+                self.put(metrics, stage, out_queues[out], item)
+
+    def download(self, pdf):
+        """
+        Fetch pdf, only PDFs not already parsed by this parser version go on to parsing
+
+        A PDF that is unchanged on the server but has no manifest entry, e.g. because its parse failed in an earlier
+        run, is read from disk and parsed again.
+        """
+        content = fetch(
+            pdf["url"],
+            pdf["file_name"],
+            session=self.session,
+            http_state=self.http_state,
+            checksum_index=self.checksum_index,
+        )
+        if self.manifest.lookup(pdf["file_name"]):
+            self.unchanged.append(pdf["file_name"])
+            return 1
+        if content is None:
+            content = pdf["file_name"].read_bytes()
+        elif self.verbose:
+            print(f"Downloaded '{pdf['url']}'")
+        pdf["content"] = content
+        return 0
+
+    def parse(self, pdf):
+        if not hasattr(self.local, "parser"):
+            self.local.parser = InterestParser(verbose=self.verbose)
+        parser = self.local.parser
+        meta, pdf["reps"] = parser.parse_bytes(pdf.pop("content"))
+        pdf["updated_at"] = meta["updated_at"].strftime("%Y-%m-%d")
+        pdf["page_index"] = parser.page_index
+        return 0
+
+    def write(self, pdf):
+        """Collect parsed PDFs and save them in seq order, PDFs that were not parsed only move the order on"""
+        self.pending[pdf["seq"]] = pdf
+        while self.next_seq in self.pending:
+            pdf = self.pending.pop(self.next_seq)
+            self.next_seq += 1
+            try:
+                self.save(pdf)
+            except Exception as e:
+                print(f"Failed write of '{pdf['file_name']}': {e!r}")
+                self.failed.append(pdf["file_name"])
+
+    def save(self, pdf):
+        updated_at_str = pdf.get("updated_at")
+        if updated_at_str is None:
+            return
+        if updated_at_str in self.written:
+            print("Skipping already parsed '{}'".format(pdf["file_name"]))
+        else:
+            if self.verbose:
+                print(f"Writing {updated_at_str}")
+            self.writer.save(updated_at_str, pdf["reps"], page_index=pdf["page_index"])
+            self.written.append(updated_at_str)
+        self.manifest.record(pdf["file_name"], updated_at_str, self.writer.output_paths(updated_at_str))
+
+    def print_summary(self):
+        stages = self.metrics.stages
+        print(f"NEW: {len(self.written)}")
+        print(f"EXISTING: {len(self.unchanged)}")
+        print(f"FAILED: {len(self.failed)}")
+        print(f"{'stage':<10}{'workers':>8}{'items':>7}{'busy s':>9}{'blocked s':>11}")
+        for stage in STAGES:
+            busy = stages.get(stage, {}).get("seconds", 0.0)
+            blocked = stages.get(f"{stage}_blocked", {}).get("seconds", 0.0)
+            items = self.metrics.counters[stage]
+            print(f"{stage:<10}{self.workers[stage]:>8}{items:>7}{busy:>9.2f}{blocked:>11.2f}")
+        print(f"{'wall':<10}{'':>15}{stages['wall']['seconds']:>9.2f}")
+
+
+def parse_cli_args():
+    p = argparse.ArgumentParser(description="Scrape, download, parse and write new registers as one pipeline")
+    p.add_argument("--verbose", action="store_true", default=False, help="Verbose output")
+    p.add_argument("--jobs", type=int, default=4, help="Number of concurrent downloads")
+    p.add_argument("--parse-jobs", type=int, default=2, help="Number of concurrent parsers")
+    p.add_argument("--queue-size", type=int, default=2, help="PDFs waiting between stages before a stage blocks")
+
+    return vars(p.parse_args())
+
+
+if __name__ == "__main__":
+    updater = Updater(**parse_cli_args())
+    updater.run()
+    updater.print_summary()
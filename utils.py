@@ -1,14 +1,25 @@
 # -*- coding: utf-8 -*-
 import csv
+import gzip
 import hashlib
+import io
 import json
+import re
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from subprocess import Popen, PIPE
+from xml.etree import ElementTree
 
 import requests
 import xmltodict
 
+from metrics import NULL_METRICS
+from models import Page
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 MONTHS_NB = {
     "januar": "01",
     "februar": "02",
@@ -24,6 +35,12 @@ MONTHS_NB = {
     "desember": "12",
 }
 
+# poppler opens "fd://<n>" as a file descriptor, used to pipe PDF content to pdftohtml
+PDFTOHTML_STDIN = "fd://0"
+MIN_SHARD_PAGES = 8  # smaller shards cost more in pdftohtml startup than they save
+DOWNLOAD_TIMEOUT = 60  # seconds, per request
+DOWNLOAD_RETRIES = 3
+
 
 def file_checksum(path: Path):
     buf_size = 128 * 1024  # 128kb chunks
@@ -48,24 +65,243 @@ def is_int(text):
         return False
 
 
+def write_if_changed(path: Path, content: bytes):
+    """
+    Write content to path unless it already has the same content, returns True if the file was written
+
+    Files are written to a temp file in the same directory and renamed into place, so readers never see a partial
+    file and unchanged files keep their mtime.
+    """
+    if path.exists() and path.stat().st_size == len(content):
+        if file_checksum(path) == hashlib.sha1(content).hexdigest():
+            return False
+
+    with tempfile.NamedTemporaryFile("wb", dir=path.parent, delete=False) as f:
+        f.write(content)
+    tmp_file_path = Path(f.name)
+    tmp_file_path.chmod(0o644)
+    tmp_file_path.replace(path)
+    return True
+
+
+def dumps_json(data, compact=False):
+    if compact:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+def dumps_csv(data, field_names):
+    buffer = io.StringIO(newline="")
+    writer = csv.DictWriter(buffer, fieldnames=field_names)
+    writer.writeheader()
+    writer.writerows(data)
+    return buffer.getvalue()
+
+
 def write_json(path: Path, data):
-    with path.open("w+") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    return write_if_changed(path, dumps_json(data).encode("utf-8"))
+
+
+def write_json_gz(path: Path, data):
+    """Compact gzipped JSON, byte for byte reproducible (no timestamp in the gzip header)"""
+    return write_if_changed(path, gzip.compress(dumps_json(data, compact=True).encode("utf-8"), mtime=0))
 
 
 def write_csv(path: Path, data, field_names):
-    with path.open("w", newline="") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=field_names)
-        writer.writeheader()
-        writer.writerows(data)
+    return write_if_changed(path, dumps_csv(data, field_names).encode("utf-8"))
 
 
-def pdf_to_xml_dict(file_path):
-    """ Transform pdf into a python dictionary containing PDF data"""
-    p = Popen(["pdftohtml", "-i", "-xml", "-stdout", file_path], stdout=PIPE, stderr=PIPE)
+@lru_cache()
+def poppler_version():
+    p = Popen(["pdftohtml", "-v"], stdout=PIPE, stderr=PIPE)
     out, err = p.communicate()
+    m = re.search(r"version ([\w.]+)", (out + err).decode("utf-8", "replace"))
+    return m.group(1) if m else "unknown"
+
+
+def pdftohtml_args(file_path, first_page=None, last_page=None):
+    """pdftohtml command line, file_path can be PDFTOHTML_STDIN to read the PDF from a pipe"""
+    args = ["pdftohtml", "-i", "-xml", "-stdout"]
+    if first_page is not None:
+        args += ["-f", str(first_page)]
+    if last_page is not None:
+        args += ["-l", str(last_page)]
+    return args + [str(file_path)]
+
+
+def run_pdftohtml(file_path, first_page=None, last_page=None):
+    """pdftohtml XML output of PDF file, or of PDF content given as bytes which is piped to pdftohtml"""
+    if isinstance(file_path, bytes):
+        p = Popen(pdftohtml_args(PDFTOHTML_STDIN, first_page, last_page), stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        out, err = p.communicate(input=file_path)
+    else:
+        p = Popen(pdftohtml_args(file_path, first_page, last_page), stdout=PIPE, stderr=PIPE)
+        out, err = p.communicate()
+    return out
+
+
+def pdf_page_count(file_path):
+    """Number of pages of PDF file or PDF bytes, read by pdfinfo"""
+    if isinstance(file_path, bytes):
+        p = Popen(["pdfinfo", PDFTOHTML_STDIN], stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        out, err = p.communicate(input=file_path)
+    else:
+        p = Popen(["pdfinfo", str(file_path)], stdout=PIPE, stderr=PIPE)
+        out, err = p.communicate()
+    m = re.search(r"^Pages:\s+(\d+)", out.decode("utf-8", "replace"), re.MULTILINE)
+    if not m:
+        raise ValueError(f"Could not read page count: {err.decode('utf-8', 'replace')}")
+    return int(m.group(1))
+
+
+def shard_page_ranges(page_count, shards, min_pages=MIN_SHARD_PAGES):
+    """Split pages 1..page_count into at most shards contiguous (first, last) ranges of at least min_pages"""
+    shards = max(1, min(shards, page_count // min_pages))
+    size, extra = divmod(page_count, shards)
+    ranges = []
+    first_page = 1
+    for shard in range(shards):
+        last_page = first_page + size - 1 + (1 if shard < extra else 0)
+        ranges.append((first_page, last_page))
+        first_page = last_page + 1
+    return ranges
+
+
+def as_list(value):
+    """xmltodict value as list, single elements are not wrapped in a list and missing ones are None"""
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def merge_shards(shard_dicts):
+    """
+    Merge pdf_to_xml_dict results of consecutive page ranges into one document, pages in order.
+
+    pdftohtml numbers fonts per run, declaring each font on the page it is first used. Fonts are matched across
+    shards by size, family and color, renumbered in order of first use and only declared on their first page. Fonts
+    that pdftohtml tells apart by attributes not in the XML can end up sharing an id, the parser does not use font
+    ids. Reps continuing over a shard boundary need no special handling once pages are in order.
+    """
+    merged = {**shard_dicts[0]["pdf2xml"], "page": []}
+    fonts = {}
+    for shard_dict in shard_dicts:
+        font_ids = {}
+        for page in shard_dict["pdf2xml"]["page"]:
+            if "fontspec" in page:
+                declared = []
+                for fontspec in as_list(page["fontspec"]):
+                    font_key = (fontspec.get("@size"), fontspec.get("@family"), fontspec.get("@color"))
+                    if font_key not in fonts:
+                        fonts[font_key] = str(len(fonts))
+                        declared.append({**fontspec, "@id": fonts[font_key]})
+                    font_ids[fontspec["@id"]] = fonts[font_key]
+                if declared:
+                    page["fontspec"] = declared if len(declared) > 1 else declared[0]
+                else:
+                    del page["fontspec"]
+            for text in as_list(page.get("text")):
+                if "@font" in text:
+                    text["@font"] = font_ids.get(text["@font"], text["@font"])
+            merged["page"].append(page)
+    return {"pdf2xml": merged}
+
 
-    return xmltodict.parse(out.decode("utf-8"))
+def pdf_to_xml_dict(file_path, cache=None, first_page=None, last_page=None, metrics=NULL_METRICS, shards=1):
+    """
+    Transform pdf into a python dictionary containing PDF data, read from/stored in cache if given
+
+    file_path can also be the PDF content as bytes, it is then fed to pdftohtml over a pipe without touching disk.
+    first_page/last_page limit extraction to a page range (1-indexed, inclusive), the cache is only used for
+    whole documents. With shards > 1 whole documents are extracted as page ranges by concurrent pdftohtml
+    processes, see merge_shards.
+    """
+    if first_page is not None or last_page is not None:
+        cache = None
+
+    key = None
+    if cache is not None:
+        with metrics.stage("layout_cache"):
+            key = cache.key(file_path)
+            pdf_dict = cache.get(key)
+        if pdf_dict is not None:
+            metrics.count("layout_cache_hits")
+            return pdf_dict
+
+    if shards > 1 and first_page is None and last_page is None:
+        with metrics.stage("pdftohtml"):
+            page_ranges = shard_page_ranges(pdf_page_count(file_path), shards)
+            with ThreadPoolExecutor(max_workers=len(page_ranges)) as executor:
+                outs = list(executor.map(lambda page_range: run_pdftohtml(file_path, *page_range), page_ranges))
+        metrics.count("xml_bytes", sum(len(out) for out in outs))
+        metrics.count("shards", len(outs))
+        with metrics.stage("xml_to_dict"):
+            pdf_dict = merge_shards([xmltodict.parse(out.decode("utf-8"), force_list=("page",)) for out in outs])
+    else:
+        with metrics.stage("pdftohtml"):
+            out = run_pdftohtml(file_path, first_page, last_page)
+        metrics.count("xml_bytes", len(out))
+        with metrics.stage("xml_to_dict"):
+            pdf_dict = xmltodict.parse(out.decode("utf-8"), force_list=("page",))
+
+    if cache is not None:
+        cache.put(key, pdf_dict)
+
+    return pdf_dict
+
+
+def xml_element_to_dict(element):
+    """Convert an ElementTree element into the same structure xmltodict.parse produces"""
+    node = {f"@{key}": value for key, value in element.attrib.items()}
+    for child in element:
+        value = xml_element_to_dict(child)
+        if child.tag not in node:
+            node[child.tag] = value
+        elif isinstance(node[child.tag], list):
+            node[child.tag].append(value)
+        else:
+            node[child.tag] = [node[child.tag], value]
+
+    text = ((element.text or "") + "".join(child.tail or "" for child in element)).strip()
+    if text:
+        if not node:
+            return text
+        node["#text"] = text
+
+    return node or None
+
+
+def iter_pdf_pages(file_path, chunk_size=64 * 1024, model=False):
+    """
+    Stream pdftohtml XML output and yield one page dict at a time
+
+    Pages have the same structure as pdf_to_xml_dict(file_path)["pdf2xml"]["page"][i], or are models.Page if model
+    is set, but only the page being parsed is kept in memory and parsing overlaps with the pdftohtml subprocess.
+    Raises RuntimeError with pdftohtml's error output if it fails.
+    """
+    # stderr goes to a file, a pipe that fills up while stdout is read would block pdftohtml
+    with tempfile.TemporaryFile() as stderr:
+        p = Popen(pdftohtml_args(file_path), stdout=PIPE, stderr=stderr)
+        pull_parser = ElementTree.XMLPullParser(events=("start", "end"))
+        root = None
+        try:
+            for chunk in iter(lambda: p.stdout.read(chunk_size), b""):
+                pull_parser.feed(chunk)
+                for event, element in pull_parser.read_events():
+                    if event == "start" and root is None:
+                        root = element
+                    elif event == "end" and element.tag == "page":
+                        yield Page.from_element(element) if model else xml_element_to_dict(element)
+                        root.remove(element)
+            if p.wait():
+                stderr.seek(0)
+                raise RuntimeError(f"pdftohtml failed for {file_path}: {stderr.read().decode('utf-8', 'replace')}")
+            pull_parser.close()
+        finally:
+            p.stdout.close()
+            if p.poll() is None:
+                p.kill()
+            p.wait()
 
 
 def pdf_to_text(file_path):
@@ -75,22 +311,90 @@ def pdf_to_text(file_path):
     return out.decode("utf-8")
 
 
-def download(url, path: Path):
-    """ Download new file, if checksum changed then overwrite if not do nothing"""
+def make_session(pool_size=10, retries=DOWNLOAD_RETRIES):
+    """Requests session with a connection pool of pool_size and retries with backoff on connection/5xx errors"""
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-    r = requests.get(url, stream=True)
-    with tempfile.NamedTemporaryFile("wb", delete=False) as f:
-        for chunk in r.iter_content(chunk_size=4096):
-            if chunk:
-                f.write(chunk)
 
-    tmp_file_path = Path(f.name)
+def read_json(path: Path, default=None):
+    if not path.exists():
+        return default
+    with path.open() as f:
+        return json.load(f)
 
-    if path.exists() and file_checksum(tmp_file_path) == file_checksum(path):
-        tmp_file_path.unlink()
-        return False
 
-    # Move/overwrite
-    tmp_file_path.rename(path)
+def fetch(url, path: Path, session=None, timeout=DOWNLOAD_TIMEOUT, http_state=None, checksum_index=None):
+    """
+    Download file into memory, returns its content if new or changed, else None
 
-    return True
+    If http_state (url -> validators dict) is given, the request is made conditional on the stored
+    ETag/Last-Modified, a 304 response returns without transferring the body. http_state is updated in place, only
+    once the whole body is read and compared or written, a failed download must not be answered with 304 next time.
+
+    The download is hashed while streaming, with a checksum_index the existing file is not re-read either. Changed
+    content is written to path and returned, so it can be handed to the parser without reading it back from disk.
+    """
+    r = conditional_get(url, path, session=session, timeout=timeout, http_state=http_state)
+    if r is None:
+        return None
+
+    sha1 = hashlib.sha1()
+    chunks = []
+    for chunk in r.iter_content(chunk_size=128 * 1024):
+        if chunk:
+            chunks.append(chunk)
+            sha1.update(chunk)
+
+    checksum = sha1.hexdigest()
+    if path.exists():
+        existing_checksum = checksum_index.checksum(path) if checksum_index is not None else file_checksum(path)
+        if checksum == existing_checksum:
+            record_validators(url, r, http_state)
+            return None
+
+    content = b"".join(chunks)
+    write_if_changed(path, content)
+    if checksum_index is not None:
+        checksum_index.update(path, checksum)
+    record_validators(url, r, http_state)
+
+    return content
+
+
+def conditional_get(url, path: Path, session=None, timeout=DOWNLOAD_TIMEOUT, http_state=None):
+    """
+    Streaming GET of url, conditional on the ETag/Last-Modified in http_state if path exists
+
+    Returns None on 304 Not Modified, else the response, see record_validators.
+    """
+    headers = {}
+    validators = (http_state or {}).get(url)
+    if validators and path.exists() and validators.get("content_length") in (None, path.stat().st_size):
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    r = (session or requests).get(url, stream=True, timeout=timeout, headers=headers)
+    if r.status_code == 304:
+        r.close()
+        return None
+    r.raise_for_status()
+    return r
+
+
+def record_validators(url, r, http_state=None):
+    """Record the ETag/Last-Modified/Content-Length of response r in http_state, for the next conditional_get"""
+    if http_state is None:
+        return
+    content_length = r.headers.get("Content-Length")
+    http_state[url] = {
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "content_length": int(content_length) if content_length else None,
+    }
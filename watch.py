@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+import argparse
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+from manifest import ParseManifest
+from parser import InterestParser
+from scraper import PDF_LIST_URL, scrape
+from settings import DATA_DIR, MANIFEST_PATH, PDF_DIR, TIMELINES_DIR
+from snapshots import normalize_reps, snapshot_date, snapshot_paths
+
+DEFAULT_INTERVAL = 60 * 60  # seconds between polls of the listing page
+DEFAULT_CACHE_SIZE = 16  # parsed snapshots kept in memory
+TIMELINE_KEY_PATTERN = re.compile(r"[\w-]+")
+
+
+def etag(body: bytes):
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+class SnapshotCache:
+    """
+    Bounded in-memory cache of parsed snapshots read from data_dir, least recently used snapshots are dropped first.
+
+    Entries keep the parsed data, the JSON body as served and its ETag.
+    """
+
+    def __init__(self, data_dir: Path = DATA_DIR, max_entries=DEFAULT_CACHE_SIZE):
+        self.data_dir = data_dir
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def dates(self):
+        return [snapshot_date(path) for path in snapshot_paths(self.data_dir)]
+
+    def latest_date(self):
+        dates = self.dates()
+        return dates[-1] if dates else None
+
+    def get(self, updated_at_str):
+        """Entry dict with data, body and etag of snapshot, None if there is no such snapshot"""
+        with self.lock:
+            if updated_at_str in self.entries:
+                self.entries.move_to_end(updated_at_str)
+                return self.entries[updated_at_str]
+
+        path = self.data_dir.joinpath(f"interests-{updated_at_str}.json")
+        if not path.exists():
+            return None
+        body = path.read_bytes()
+        entry = {"data": json.loads(body), "body": body, "etag": etag(body)}
+
+        with self.lock:
+            self.entries[updated_at_str] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, updated_at_str):
+        with self.lock:
+            self.entries.pop(updated_at_str, None)
+
+
+class Watcher:
+    """Poll the listing page, download and parse new registers and refresh the snapshot cache"""
+
+    def __init__(
+        self,
+        cache: SnapshotCache,
+        list_url=PDF_LIST_URL,
+        pdf_dir: Path = PDF_DIR,
+        interval=DEFAULT_INTERVAL,
+        jobs=4,
+        verbose=False,
+    ):
+        self.cache = cache
+        self.list_url = list_url
+        self.pdf_dir = pdf_dir
+        self.interval = interval
+        self.jobs = jobs
+        self.verbose = verbose
+        self.parser = InterestParser(verbose=verbose)
+        self.stopped = threading.Event()
+
+    def poll(self):
+        """Scrape once and parse new registers, returns the dates of parsed snapshots"""
+        parsed = []
+        manifest = ParseManifest.load(MANIFEST_PATH, InterestParser.PARSER_VERSION)
+        try:
+            for pdf in scrape(verbose=self.verbose, jobs=self.jobs, list_url=self.list_url, pdf_dir=self.pdf_dir):
+                updated_at_str = self.parser.parse_and_save(pdf, archive_pdf=False, manifest=manifest)
+                if updated_at_str:
+                    self.cache.invalidate(updated_at_str)
+                    parsed.append(updated_at_str)
+        finally:
+            manifest.save()
+        return parsed
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                parsed = self.poll()
+                if parsed:
+                    print(f"Parsed {', '.join(parsed)}")
+            except Exception as e:
+                print(f"Failed polling '{self.list_url}': {e!r}")
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+
+
+def make_server(cache: SnapshotCache, host="127.0.0.1", port=8000, timelines_dir: Path = TIMELINES_DIR):
+    """
+    HTTP API over cache:
+
+    - /snapshots: dates of all snapshots
+    - /snapshots/latest and /snapshots/<date>: snapshot JSON as in DATA_DIR
+    - /reps?last_name=<last name>[&first_name=<first name>][&date=<date>]: matching reps in the latest (or given)
+      snapshot, in the current format also for older snapshots
+    - /timelines/<key>: timeline of a rep as written by timelines.Timelines, e.g. /timelines/aas-johan-frp
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            parts = url.path.strip("/").split("/")
+
+            if parts == ["snapshots"]:
+                self.send_json(json.dumps(cache.dates()).encode("utf-8"))
+            elif len(parts) == 2 and parts[0] == "snapshots":
+                entry = cache.get(cache.latest_date() if parts[1] == "latest" else parts[1])
+                if entry is None:
+                    self.send_error(404)
+                    return
+                self.send_json(entry["body"], entry["etag"])
+            elif parts == ["reps"] and "last_name" in query:
+                self.send_reps(query)
+            elif len(parts) == 2 and parts[0] == "timelines":
+                self.send_timeline(unquote(parts[1]))
+            else:
+                self.send_error(404)
+
+        def send_reps(self, query):
+            updated_at_str = query.get("date") or cache.latest_date()
+            entry = cache.get(updated_at_str) if updated_at_str else None
+            if entry is None:
+                self.send_error(404)
+                return
+            reps = [
+                rep
+                for rep in normalize_reps(entry["data"], InterestParser.INTEREST_CATS)
+                if rep["last_name"] == query["last_name"]
+                and query.get("first_name", rep["first_name"]) == rep["first_name"]
+            ]
+            if not reps:
+                self.send_error(404)
+                return
+            body = json.dumps({"updated_at": updated_at_str, "reps": reps}, ensure_ascii=False).encode("utf-8")
+            self.send_json(body)
+
+        def send_timeline(self, key):
+            path = timelines_dir.joinpath(f"{key}.json")
+            if not TIMELINE_KEY_PATTERN.fullmatch(key) or not path.exists():
+                self.send_error(404)
+                return
+            self.send_json(path.read_bytes())
+
+        def send_json(self, body, body_etag=None):
+            body_etag = body_etag or etag(body)
+            if self.headers.get("If-None-Match") == body_etag:
+                self.send_response(304)
+                self.send_header("ETag", body_etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("ETag", body_etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def parse_cli_args():
+    p = argparse.ArgumentParser(description="Poll for new registers, parse them and serve parsed snapshots over HTTP")
+    p.add_argument("--interval", type=int, default=DEFAULT_INTERVAL, help="Seconds between polls")
+    p.add_argument("--host", default="127.0.0.1", help="Address to serve on")
+    p.add_argument("--port", type=int, default=8000, help="Port to serve on")
+    p.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, help="Snapshots kept in memory")
+    p.add_argument("--jobs", type=int, default=4, help="Number of concurrent downloads")
+    p.add_argument("--verbose", action="store_true", default=False, help="Verbose output")
+
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_cli_args()
+    snapshot_cache = SnapshotCache(max_entries=args.cache_size)
+    watcher = Watcher(snapshot_cache, interval=args.interval, jobs=args.jobs, verbose=args.verbose)
+    watcher.parser.restore_outputs()
+    threading.Thread(target=watcher.run, daemon=True).start()
+    server = make_server(snapshot_cache, args.host, args.port)
+    print(f"Serving on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        server.server_close()